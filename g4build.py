@@ -0,0 +1,198 @@
+"""
+g4py/g4build.py
+- CMake configure, build and install steps for Geant4
+"""
+
+import os, shutil, subprocess, json
+
+GENERATORS = {"make": "Unix Makefiles", "ninja": "Ninja"}
+LAUNCHERS  = ["ccache", "sccache"]
+
+# ---------------- Options ----------------
+def cmakeOptions(installDir, dataDir, qt=True, defines=()):
+    """
+    Every cache entry of the build, so that Geant4 is configured (and compiled) only once.
+    `defines` are extra "NAME=VALUE" strings that override the defaults.
+    """
+    options = {
+        "CMAKE_INSTALL_PREFIX"  : installDir,
+        "GEANT4_INSTALL_DATADIR": dataDir,
+        "GEANT4_USE_QT"         : "ON" if qt else "OFF",
+    }
+    for define in defines:
+        name, _, value = define.partition("=")
+        options[name] = value
+    return options
+
+def launcherOptions(launcher):
+    """ Compiler launcher cache entries; empty values clear a launcher used by an earlier run """
+    return {"CMAKE_C_COMPILER_LAUNCHER"  : launcher or "",
+            "CMAKE_CXX_COMPILER_LAUNCHER": launcher or ""}
+
+def _cachedGenerator(buildDir):
+    try:
+        with open(f"{buildDir}/CMakeCache.txt") as f:
+            for line in f:
+                if line.startswith("CMAKE_GENERATOR:"):
+                    return line.split("=", 1)[1].strip()
+    except OSError:
+        pass
+    return None
+
+# ---------------- Steps ----------------
+def configure(srcDir, buildDir, options, generator="make"):
+    """ Configure `buildDir` from `srcDir` in a single cmake invocation """
+    os.makedirs(buildDir, exist_ok=True)
+
+    # CMake refuses to switch generators in an existing build tree
+    cached = _cachedGenerator(buildDir)
+    if cached and cached != GENERATORS[generator]:
+        os.remove(f"{buildDir}/CMakeCache.txt")
+        shutil.rmtree(f"{buildDir}/CMakeFiles", ignore_errors=True)
+
+    return subprocess.run(["cmake", "-S", srcDir, "-B", buildDir, "-G", GENERATORS[generator]]
+                          + [f"-D{name}={value}" for name, value in options.items()]).returncode
+
+def build(buildDir, jobs, maxLoad=None):
+    """ Compile with `jobs` parallel jobs; make and ninja both take `-l` to hold back above `maxLoad` """
+    return subprocess.run(["cmake", "--build", buildDir, "--parallel", str(jobs)]
+                          + (["--", "-l", f"{maxLoad:g}"] if maxLoad else [])).returncode
+
+def install(buildDir):
+    return subprocess.run(["cmake", "--install", buildDir]).returncode
+
+# ---------------- Parallelism ----------------
+def _read(path):
+    with open(path) as f:
+        return f.read().strip()
+
+def _cgroupCpuQuota():
+    """ CPUs granted by the cgroup (v2, then v1) CPU quota, or None if unlimited """
+    try:
+        quota, period = _read("/sys/fs/cgroup/cpu.max").split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        quota  = int(_read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us"))
+        period = int(_read("/sys/fs/cgroup/cpu/cpu.cfs_period_us"))
+        if quota > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+def availableCpus():
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:   # macOS, Windows
+        cpus = os.cpu_count() or 1
+    quota = _cgroupCpuQuota()
+    if quota:
+        cpus = min(cpus, int(quota))
+    return max(1, cpus)
+
+def availableMemory():
+    """ Bytes of memory the build can use (host and cgroup limits), or None if unknown """
+    limits = []
+
+    try:
+        for line in _read("/proc/meminfo").splitlines():
+            if line.startswith("MemAvailable:"):
+                limits.append(int(line.split()[1]) * 1024)
+    except (OSError, ValueError):
+        try:
+            limits.append(os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE"))
+        except (AttributeError, ValueError, OSError):
+            pass
+
+    for limitPath, usagePath in [("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+                                 ("/sys/fs/cgroup/memory/memory.limit_in_bytes",
+                                  "/sys/fs/cgroup/memory/memory.usage_in_bytes")]:
+        try:
+            limits.append(int(_read(limitPath)) - int(_read(usagePath)))
+            break
+        except (OSError, ValueError):   # missing, or "max"
+            continue
+
+    return max(0, min(limits)) if limits else None
+
+def autoJobs(memPerJob=2.0):
+    """
+    Parallel compile jobs that fit the available CPUs (affinity and cgroup quota)
+    and memory, assuming `memPerJob` GB per compiler process. One CPU is left
+    free on machines with more than two, and the result is never below 1.
+    """
+    cpus = availableCpus()
+    jobs = cpus - 1 if cpus > 2 else cpus
+
+    memory = availableMemory()
+    if memory is not None:
+        jobs = min(jobs, int(memory // (memPerJob * 1024**3)))
+
+    return max(1, jobs)
+
+# ---------------- Compiler cache ----------------
+def findLauncher(preferred="auto"):
+    """ Path of the compiler cache to wrap the compiler with, or None """
+    if preferred == "off":
+        return None
+    for name in (LAUNCHERS if preferred == "auto" else [preferred]):
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+def _isSccache(launcher):
+    return os.path.basename(launcher).startswith("sccache")
+
+def launcherEnv(launcher, cacheDir, maxSize, baseDir):
+    """
+    Environment that points the launcher at a managed cache directory of `maxSize` GB.
+    For ccache, paths under `baseDir` are hashed relative to the build directory, so the
+    same tree laid out the same way elsewhere (another base directory, user or host) hits.
+    Different Geant4 versions do not: their sources sit at ../geant4-v<version>/ and differ.
+    """
+    if _isSccache(launcher):
+        return {"SCCACHE_DIR": cacheDir, "SCCACHE_CACHE_SIZE": f"{maxSize:g}G"}
+    return {"CCACHE_DIR"      : cacheDir,
+            "CCACHE_MAXSIZE"  : f"{maxSize:g}G",
+            "CCACHE_BASEDIR"  : baseDir,
+            "CCACHE_NOHASHDIR": "true"}
+
+def launcherStats(launcher):
+    """
+    Cumulative (hits, misses) of the compiler cache, or None if they cannot be read.
+    Callers diff two snapshots instead of zeroing, which would disturb other
+    builds sharing the same cache.
+    """
+    if _isSccache(launcher):
+        try:
+            out = subprocess.run([launcher, "--show-stats", "--stats-format=json"],
+                                 capture_output=True, text=True).stdout
+            stats = json.loads(out)["stats"]
+            return (sum(stats["cache_hits"]["counts"].values()),
+                    sum(stats["cache_misses"]["counts"].values()))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    # ccache >= 4 has machine-readable stats, older versions only the summary table
+    try:
+        out = subprocess.run([launcher, "--print-stats"], capture_output=True, text=True)
+        if out.returncode == 0:
+            stats = dict(line.split("\t", 1) for line in out.stdout.splitlines() if "\t" in line)
+            return (int(stats.get("direct_cache_hit", 0)) + int(stats.get("preprocessed_cache_hit", 0)),
+                    int(stats.get("cache_miss", 0)))
+
+        out = subprocess.run([launcher, "-s"], capture_output=True, text=True).stdout
+        hits = misses = 0
+        for line in out.splitlines():
+            value = line.split()[-1] if line.split() else ""
+            if line.startswith("cache hit") and value.isdigit():
+                hits += int(value)
+            elif line.startswith("cache miss") and value.isdigit():
+                misses += int(value)
+        return (hits, misses)
+    except (OSError, ValueError):
+        return None
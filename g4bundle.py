@@ -0,0 +1,140 @@
+"""
+g4py/g4bundle.py
+- Relocatable prebuilt Geant4 install trees, packed once and unpacked
+  in place of compiling on machines with a matching toolchain
+"""
+
+import os, json, time, hashlib, platform, shutil, socket, subprocess, tarfile
+import g4data
+
+# Paths the bundle is relocated away from, and entries that never go into it
+RELOCATED = ["CMAKE_INSTALL_PREFIX", "GEANT4_INSTALL_DATADIR",
+             "CMAKE_C_COMPILER_LAUNCHER", "CMAKE_CXX_COMPILER_LAUNCHER"]
+EXCLUDED  = ["share/Geant4/data", ".g4dl-state.json"]
+
+# ---------------- Keys ----------------
+def compilerId():
+    """ First line of `$CXX --version`, or "" if there is no C++ compiler """
+    try:
+        out = subprocess.run([os.environ.get("CXX", "c++"), "--version"], capture_output=True, text=True).stdout
+        return out.splitlines()[0].strip() if out else ""
+    except OSError:
+        return ""
+
+def platformId():
+    """ OS, distribution release, architecture and C library the binaries were linked against """
+    system = platform.system()
+    try:
+        release = platform.freedesktop_os_release()
+        system += f" {release.get('ID', '')} {release.get('VERSION_ID', '')}"
+    except (AttributeError, OSError):   # Python < 3.10, macOS, Windows
+        system += f" {platform.release() if system == 'Darwin' else ''}"
+    return f"{system.strip()} {platform.machine()} {' '.join(platform.libc_ver())}".strip()
+
+def bundleKey(version, options):
+    """
+    Identity of a build: Geant4 version, CMake options (minus the paths that
+    are rewritten on unpacking), compiler and platform. Returns (key, fields).
+    """
+    fields = {"version" : version,
+              "options" : {name: value for name, value in sorted(options.items()) if name not in RELOCATED},
+              "compiler": compilerId(),
+              "platform": platformId()}
+    digest = hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+    return f"geant4-v{version}-{digest[:16]}", fields
+
+def bundlePath(bundleDir, key):
+    return f"{bundleDir}/{key}.tar.gz"
+
+def exists(bundleDir, key):
+    return os.path.exists(bundlePath(bundleDir, key)) and os.path.exists(f"{bundleDir}/{key}.json")
+
+# ---------------- Packing ----------------
+def pack(installDir, bundleDir, key, fields):
+    """
+    Compress `installDir` (without the datasets) into the bundle repository
+    `bundleDir`, next to a JSON description holding the original prefix.
+    Both are renamed into place, so the repository can be shared over NFS.
+    """
+    os.makedirs(bundleDir, exist_ok=True)
+    installDir = os.path.abspath(installDir)
+
+    def exclude(info):
+        name = info.name.split("/", 1)[1] if "/" in info.name else ""
+        return None if any(name == path or name.startswith(f"{path}/") for path in EXCLUDED) else info
+
+    tmp = f"{bundlePath(bundleDir, key)}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with tarfile.open(tmp, "w:gz", compresslevel=6) as tar:
+        tar.add(installDir, arcname=key, filter=exclude)
+    os.replace(tmp, bundlePath(bundleDir, key))
+
+    with open(f"{tmp}.json", "w") as f:
+        json.dump({**fields, "key": key, "prefix": installDir, "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                   "host": platform.node()}, f, indent=4)
+    os.replace(f"{tmp}.json", f"{bundleDir}/{key}.json")
+    return bundlePath(bundleDir, key)
+
+# ---------------- Unpacking ----------------
+def _isText(path):
+    with open(path, "rb") as f:
+        return b"\0" not in f.read(8192)
+
+def relocate(installDir, oldPrefix):
+    """
+    Rewrite `oldPrefix` to `installDir` in every text file of the install:
+    geant4-config, geant4make.sh/.csh, geant4.sh and the CMake/pkg-config files.
+    Binaries are left alone; Geant4 finds its libraries through these files.
+    Returns the number of files rewritten.
+    """
+    old, new = oldPrefix.encode(), os.path.abspath(installDir).encode()
+    rewritten = 0
+
+    for dirpath, dirnames, files in os.walk(installDir):
+        dirnames[:] = [d for d in dirnames if os.path.relpath(f"{dirpath}/{d}", installDir) not in EXCLUDED]
+        for file in files:
+            path = f"{dirpath}/{file}"
+            if os.path.islink(path) or not _isText(path):
+                continue
+            with open(path, "rb") as f:
+                content = f.read()
+            if old not in content:
+                continue
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(content.replace(old, new))
+            shutil.copymode(path, f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+            rewritten += 1
+
+    return rewritten
+
+def _moveInto(src, dest, rel=""):
+    """ Move the entries of `src` over those of `dest`, descending only above the EXCLUDED paths """
+    os.makedirs(dest, exist_ok=True)
+    for entry in os.listdir(src):
+        path, target = f"{rel}{entry}", f"{dest}/{entry}"
+        if any(excluded.startswith(f"{path}/") for excluded in EXCLUDED):
+            _moveInto(f"{src}/{entry}", target, f"{path}/")
+            continue
+        if os.path.isdir(target) and not os.path.islink(target):
+            shutil.rmtree(target)
+        elif os.path.lexists(target):
+            os.remove(target)
+        os.replace(f"{src}/{entry}", target)
+
+def unpack(bundleDir, key, installDir):
+    """ Extract bundle `key` into `installDir`, keeping its datasets, and relocate it there """
+    with open(f"{bundleDir}/{key}.json") as f:
+        meta = json.load(f)
+
+    staging = f"{installDir}.unpacking"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    with tarfile.open(bundlePath(bundleDir, key)) as tar:
+        g4data.extractTar(tar, staging)
+
+    # Everything but the datasets (and the installer state) is replaced
+    _moveInto(f"{staging}/{key}", installDir)
+    shutil.rmtree(staging)
+
+    return relocate(installDir, meta["prefix"])
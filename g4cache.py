@@ -0,0 +1,135 @@
+"""
+g4py/g4cache.py
+- Content-addressed artifact cache shared across Geant4 versions and hosts
+"""
+
+import os, json, hashlib, socket
+import g4fetch, g4data
+
+DEFAULT_DIR  = os.environ.get("G4PY_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "g4py"))
+DEFAULT_SIZE = 20 * 1024**3   # 20 GiB
+
+def sha256sum(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(g4fetch.CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+class Cache:
+    """
+    Source tarballs and dataset archives keyed by URL plus checksum.
+
+    root
+        |____ objects/ab/abcdef...    archive bytes, named by their sha256
+        |____ urls/<sha256(url)>      {"url", "sha256", "size"}
+        |____ tmp/                    resumable partial downloads
+
+    Every write is a rename, so several hosts can share the cache over NFS.
+    Least recently used objects are evicted once `maxSize` bytes is exceeded.
+    """
+
+    def __init__(self, root=DEFAULT_DIR, maxSize=DEFAULT_SIZE):
+        self.root = root
+        self.maxSize = maxSize
+        for sub in ["objects", "urls", "tmp"]:
+            os.makedirs(f"{root}/{sub}", exist_ok=True)
+
+    def _urlPath(self, url):
+        return f"{self.root}/urls/{hashlib.sha256(url.encode()).hexdigest()}"
+
+    def _objectPath(self, sha256):
+        return f"{self.root}/objects/{sha256[:2]}/{sha256}"
+
+    def tmpPath(self, url):
+        """ Per-host scratch file for `url`, stable across runs so downloads can resume """
+        return f"{self.root}/tmp/{os.path.basename(self._urlPath(url))}.{socket.gethostname()}"
+
+    # ---------------- Lookup ----------------
+    def entry(self, url):
+        """ {"url", "sha256", "size"} recorded for `url`, or None """
+        try:
+            with open(self._urlPath(url)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def lookup(self, url, sha256=None):
+        """ Path of the cached archive for `url` (and `sha256`, if known), or None """
+        entry = self.entry(url)
+        if entry is None or (sha256 and entry["sha256"] != sha256):
+            return None
+
+        path = self._objectPath(entry["sha256"])
+        try:
+            os.utime(path)   # mtime doubles as the LRU clock; atime is often disabled
+        except FileNotFoundError:
+            return None
+        except OSError:
+            # Another user's object on a shared cache: readable, but its LRU time stays as is
+            if not os.path.exists(path):
+                return None
+        return path
+
+    # ---------------- Insertion ----------------
+    def commit(self, url, tmp, sha256=None):
+        """ Move the completed download `tmp` into the cache under `url` """
+        actual = sha256sum(tmp)
+        if sha256 and actual != sha256:
+            os.remove(tmp)
+            raise IOError(f"Checksum mismatch for {url}: expected {sha256}, got {actual}")
+
+        path = self._objectPath(actual)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = os.path.getsize(tmp)
+        os.replace(tmp, path)
+
+        entry = self._urlPath(url)
+        with open(f"{entry}.{socket.gethostname()}.tmp", "w") as f:
+            json.dump({"url": url, "sha256": actual, "size": size}, f)
+        os.replace(f"{entry}.{socket.gethostname()}.tmp", entry)
+
+        self.evict(keep=path)
+        return path
+
+    def fetch(self, url, sha256=None, progress=None, segments=1):
+        """ Path of the cached archive for `url`, downloading it first on a miss """
+        path = self.lookup(url, sha256)
+        if path:
+            return path
+
+        tmp = self.tmpPath(url)
+        if segments > 1:
+            g4fetch.segmentedDownload(url, tmp, segments, progress)
+        else:
+            g4fetch.download(url, tmp, progress)
+        return self.commit(url, tmp, sha256)
+
+    def install(self, url, dest, sha256=None, progress=None, segments=1):
+        """ Place the cached archive for `url` at `dest` (hardlink when possible) """
+        if not os.path.exists(dest):
+            g4data.linkOrCopy(self.fetch(url, sha256, progress, segments), dest)
+        return dest
+
+    # ---------------- Eviction ----------------
+    def evict(self, keep=None):
+        objects = []
+        for dirpath, _, files in os.walk(f"{self.root}/objects"):
+            for file in files:
+                try:
+                    stat = os.stat(f"{dirpath}/{file}")
+                except OSError:
+                    continue
+                objects.append((stat.st_mtime, stat.st_size, f"{dirpath}/{file}"))
+
+        total = sum(size for _, size, _ in objects)
+        for _, size, path in sorted(objects):
+            if total <= self.maxSize:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
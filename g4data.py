@@ -0,0 +1,218 @@
+"""
+g4py/g4data.py
+- Selection and extraction of Geant4 dataset archives into the install data
+  directory or into a shared, deduplicated dataset store
+"""
+
+import os, shutil, tarfile, hashlib, json, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# ---------------- Selection ----------------
+# Datasets needed by the physics of each profile, by archive name (G4EMLOW.8.5.tar.gz -> G4EMLOW).
+# G4ENSDFSTATE is read by the nuclide table at start-up, so every profile includes it.
+PROFILES = {
+    "em"         : ["G4ENSDFSTATE", "G4EMLOW", "G4PII"],
+    "hadronic"   : ["G4ENSDFSTATE", "G4PARTICLEXS", "G4NDL", "G4PhotonEvaporation", "G4RadioactiveDecay",
+                    "G4SAIDDATA", "G4ABLA", "G4INCL", "G4TENDL", "G4NUDEXLIB", "G4URRPT", "G4CHANNELING"],
+    "optical"    : ["G4ENSDFSTATE", "G4RealSurface"],
+    "radioactive": ["G4ENSDFSTATE", "G4PhotonEvaporation", "G4RadioactiveDecay"],
+}
+
+def datasetName(archive):
+    return os.path.basename(archive).split(".")[0]
+
+def selectDatasets(links, names=(), profiles=()):
+    """
+    The dataset `links` chosen by name and/or profile; all of them if nothing
+    (or the "all" profile) is asked for. Returns (links, unknown names).
+    """
+    if not names and not profiles or "all" in profiles:
+        return list(links), []
+
+    wanted = set(names)
+    for profile in profiles:
+        wanted.update(PROFILES[profile])
+
+    available = {datasetName(link) for link in links}
+    return ([link for link in links if datasetName(link) in wanted],
+            sorted(set(names) - available))
+
+def installedDatasets(dataDir, links):
+    """ The dataset `links` whose archives are already extracted into `dataDir` """
+    return [link for link in links if isExtracted(dataDir, os.path.basename(link))]
+
+# ---------------- Completion markers ----------------
+def markerPath(dataDir, archive):
+    return f"{dataDir}/.{archive}.done"
+
+def readMarker(dataDir, archive):
+    try:
+        with open(markerPath(dataDir, archive)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def isExtracted(dataDir, archive, size=None):
+    """
+    True if `archive` was completely extracted into `dataDir`.
+    Only the marker and the entries it lists are stat'ed; nothing is re-hashed.
+    """
+    marker = readMarker(dataDir, archive)
+    if marker is None or (size is not None and marker["size"] != size):
+        return False
+    return all(os.path.exists(f"{dataDir}/{entry}") for entry in marker["entries"])
+
+def _writeMarker(dataDir, archive, size, sha256, entries, **extra):
+    path = markerPath(dataDir, archive)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump({"archive": archive, "size": size, "sha256": sha256, "entries": entries, **extra}, f)
+    os.replace(f"{path}.tmp", path)
+
+class _HashReader:
+    """ File-like wrapper that hashes and counts everything read through it """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.sha256.update(data)
+        self.size += len(data)
+        return data
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+# ---------------- Extraction ----------------
+def extractTar(tar, path):
+    """ Extract every member of the open `tar` into `path`, refusing unsafe paths where Python can """
+    # Python >= 3.11.4 / 3.12 can refuse absolute paths and `..` in members
+    if hasattr(tarfile, "data_filter"):
+        tar.extractall(path, filter="data")
+    else:
+        tar.extractall(path)
+
+def extractStream(fileobj, dataDir, archive):
+    """
+    Extract the tarball read sequentially from `fileobj` into `dataDir`.
+    Members are unpacked into a hidden staging directory as the bytes arrive
+    and moved into place only once the whole archive has been read, so an
+    interrupted download never leaves a half-populated dataset behind.
+    A completion marker (archive name, size, sha256, entries) is written last.
+    Returns the top-level entries that were installed.
+    """
+    staging = f"{dataDir}/.{archive}.partial"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    reader = _HashReader(fileobj)
+    with tarfile.open(fileobj=reader, mode="r|*") as tar:
+        extractTar(tar, staging)
+    # Drain any trailing padding so the checksum covers the whole archive
+    while reader.read(1 << 20):
+        pass
+
+    entries = os.listdir(staging)
+    for entry in entries:
+        target = f"{dataDir}/{entry}"
+        _remove(target)
+        os.replace(f"{staging}/{entry}", target)
+    os.rmdir(staging)
+
+    _writeMarker(dataDir, archive, reader.size, reader.sha256.hexdigest(), entries)
+    return entries
+
+def extractArchive(path, dataDir):
+    with open(path, "rb") as f:
+        return extractStream(f, dataDir, os.path.basename(path))
+
+def extractAll(archives, dataDir, workers=None, progress=None):
+    """
+    Extract the dataset tarballs in `archives` into `dataDir` on a process pool,
+    skipping those whose completion marker matches the archive size.
+    `progress` is called with the size of every archive extracted.
+    Returns the list of (archive, exception) pairs that failed.
+    """
+    pending = [path for path in archives
+               if not isExtracted(dataDir, os.path.basename(path), os.path.getsize(path))]
+    failed  = []
+
+    if not pending:
+        return failed
+
+    # g4dl runs phases on threads; forking a multi-threaded process is unsafe, so spawn
+    with ProcessPoolExecutor(max_workers=min(len(pending), workers or os.cpu_count() or 1),
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(extractArchive, path, dataDir): path for path in pending}
+
+        for future in as_completed(futures):
+            archive = os.path.basename(futures[future])
+            try:
+                future.result()
+                print(f"✅ Extracted {archive}")
+                if progress:
+                    progress(os.path.getsize(futures[future]))
+            except Exception as e:
+                print(f"❌ ERROR: Failed to extract {archive}: {e}")
+                failed.append((futures[future], e))
+
+    return failed
+
+# ---------------- Shared dataset store ----------------
+def linkOrCopy(src, dest):
+    """ Hardlink `src` to `dest`, copying if they are on different filesystems """
+    tmp = f"{dest}.{os.getpid()}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copy2(src, tmp)
+    os.replace(tmp, dest)
+
+def linkDataset(storeDir, archive, dataDir, mode="symlink"):
+    """
+    Populate `dataDir` with the entries that `archive` was extracted to in `storeDir`,
+    as symlinks, hardlinked trees or plain copies, and mark it as extracted there too.
+    """
+    marker = readMarker(storeDir, archive)
+    if marker is None:
+        raise IOError(f"{archive} has not been extracted into {storeDir}")
+
+    mine = readMarker(dataDir, archive)
+    if (mine and mine["sha256"] == marker["sha256"] and isExtracted(dataDir, archive)
+            and mine.get("mode") == mode and mine.get("store") == os.path.abspath(storeDir)):
+        return marker["entries"]
+
+    for entry in marker["entries"]:
+        source = os.path.abspath(f"{storeDir}/{entry}")
+        target = f"{dataDir}/{entry}"
+        _remove(target)
+
+        if mode == "symlink":
+            os.symlink(source, target)
+        elif mode == "hardlink":
+            shutil.copytree(source, target, symlinks=True, copy_function=linkOrCopy)
+        else:
+            shutil.copytree(source, target, symlinks=True)
+
+    _writeMarker(dataDir, archive, marker["size"], marker["sha256"], marker["entries"],
+                 store=os.path.abspath(storeDir), mode=mode)
+    return marker["entries"]
+
+def linkAll(storeDir, archives, dataDir, mode="symlink"):
+    """
+    Link every dataset in `archives` (names, as extracted into `storeDir`) into `dataDir`.
+    Returns the list of (archive, exception) pairs that failed.
+    """
+    failed = []
+    for archive in archives:
+        try:
+            linkDataset(storeDir, archive, dataDir, mode)
+        except Exception as e:
+            print(f"❌ ERROR: Failed to link {archive} from {storeDir}: {e}")
+            failed.append((archive, e))
+    return failed
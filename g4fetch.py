@@ -0,0 +1,295 @@
+"""
+g4py/g4fetch.py
+- Concurrent, resumable downloads for Geant4 sources and datasets
+"""
+
+import os, re, json, hashlib, tarfile, threading, requests, urllib3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+import g4data
+
+CHUNK_SIZE   = 1 << 20    # 1 MiB
+TIMEOUT      = (15, 60)   # (connect, read) seconds
+RETRIES      = 5
+SEGMENT_MIN  = 16 << 20   # don't split files or ranges smaller than 16 MiB
+
+_local = threading.local()
+
+# ---------------- Sessions ----------------
+def getSession():
+    """ Pooled requests.Session, one per worker thread (Session is not thread-safe) """
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        session.mount("http://" , adapter)
+        session.mount("https://", adapter)
+        _local.session = session
+    return session
+
+# ---------------- Single file ----------------
+def download(url, dest, progress=None):
+    """
+    Download `url` to `dest`, resuming `dest.part` with an HTTP Range request
+    if an earlier attempt was interrupted. `dest` only appears once the file is
+    complete, so `os.path.exists(dest)` never sees a truncated archive.
+    `progress` is called with the size of every chunk received.
+    """
+    if os.path.exists(dest):
+        return dest
+
+    part = f"{dest}.part"
+    session = getSession()
+
+    for attempt in range(RETRIES):
+        offset  = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as r:
+                # Range starts at/after EOF: the previous attempt got everything
+                if r.status_code == 416 and offset:
+                    break
+
+                r.raise_for_status()
+
+                # Server ignored the Range header, start over
+                if r.status_code != 206:
+                    offset = 0
+
+                total = r.headers.get("Content-Length")
+                total = offset + int(total) if total is not None else None
+
+                with open(part, "ab" if offset else "wb") as f:
+                    for chunk in r.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                        if progress:
+                            progress(len(chunk))
+
+            if total is None or os.path.getsize(part) == total:
+                break
+
+        except requests.exceptions.RequestException as e:
+            status = getattr(e.response, "status_code", None) or 500
+            if attempt == RETRIES - 1 or status < 500:
+                raise
+    else:
+        raise IOError(f"Incomplete download of {url}")
+
+    os.replace(part, dest)
+    return dest
+
+# ---------------- Segmented ----------------
+def probe(url):
+    """ (size, acceptsRanges) of `url`, asking for its first byte """
+    with getSession().get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=TIMEOUT) as r:
+        r.raise_for_status()
+        if r.status_code == 206:
+            match = re.search(r"/(\d+)$", r.headers.get("Content-Range", ""))
+            return (int(match[1]) if match else None), bool(match)
+        size = r.headers.get("Content-Length")
+        return (int(size) if size else None), False
+
+def segmentedDownload(url, dest, segments=4, progress=None, sha256=None):
+    """
+    Download `url` to `dest` over `segments` connections, each fetching its own
+    byte range straight into a preallocated `dest.part`. Progress is kept in
+    `dest.part.json`, so an interrupted download resumes every range where it
+    stopped. The result is checked against the advertised size (and `sha256`
+    if given) before it is renamed to `dest`. Servers without range support,
+    and small files, fall back to a single `download` stream.
+    """
+    if os.path.exists(dest):
+        return dest
+
+    size, ranges = probe(url)
+    if not ranges or not size or segments <= 1 or size < 2 * SEGMENT_MIN:
+        download(url, dest, progress)
+        _verify(dest, size, sha256)
+        return dest
+
+    part, sidecar = f"{dest}.part", f"{dest}.part.json"
+    try:
+        with open(sidecar) as f:
+            plan = json.load(f)
+        if plan["url"] != url or plan["size"] != size or not os.path.exists(part):
+            raise ValueError
+    except (OSError, ValueError, KeyError):
+        step = -(-size // min(segments, size // SEGMENT_MIN))
+        plan = {"url": url, "size": size,
+                "ranges": [[start, min(start + step, size), start] for start in range(0, size, step)]}
+        with open(part, "wb") as f:
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(f.fileno(), 0, size)
+            else:
+                f.truncate(size)
+
+    lock = threading.Lock()
+
+    def save():
+        with open(f"{sidecar}.tmp", "w") as f:
+            json.dump(plan, f)
+        os.replace(f"{sidecar}.tmp", sidecar)
+
+    def fetchRange(rng):
+        start, end, _ = rng
+        session = getSession()
+        for attempt in range(RETRIES):
+            if rng[2] >= end:
+                return
+            try:
+                headers = {"Range": f"bytes={rng[2]}-{end - 1}"}
+                with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as r, open(part, "r+b") as f:
+                    r.raise_for_status()
+                    if r.status_code != 206:
+                        raise IOError(f"{url} stopped honouring range requests")
+                    f.seek(rng[2])
+                    for chunk in r.iter_content(CHUNK_SIZE):
+                        chunk = chunk[:end - rng[2]]
+                        f.write(chunk)
+                        f.flush()   # the sidecar must never claim bytes still in our buffer
+                        with lock:
+                            rng[2] += len(chunk)
+                            save()
+                        if progress:
+                            progress(len(chunk))
+            except requests.exceptions.RequestException as e:
+                status = getattr(e.response, "status_code", None) or 500
+                if attempt == RETRIES - 1 or status < 500:
+                    raise
+        if rng[2] < end:
+            raise IOError(f"Incomplete range {start}-{end - 1} of {url}")
+
+    with ThreadPoolExecutor(max_workers=len(plan["ranges"])) as pool:
+        for future in [pool.submit(fetchRange, rng) for rng in plan["ranges"]]:
+            future.result()
+
+    _verify(part, size, sha256)
+    os.replace(part, dest)
+    os.remove(sidecar)
+    return dest
+
+def _verify(path, size, sha256):
+    actual = os.path.getsize(path)
+    if size is not None and actual != size:
+        os.remove(path)
+        raise IOError(f"{os.path.basename(path)} is {actual} bytes, expected {size}")
+    if sha256:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        if digest.hexdigest() != sha256:
+            os.remove(path)
+            raise IOError(f"Checksum mismatch for {os.path.basename(path)}")
+
+def fetch(url, dest, cache=None, progress=None, segments=1, sha256=None):
+    """
+    Download `url` to `dest`, going through the artifact cache if one is given.
+    Large files are split over `segments` connections when the server allows it.
+    With `sha256` (e.g. from the release manifest), the download is verified.
+    """
+    if cache:
+        return cache.install(url, dest, sha256, progress, segments)
+    if segments > 1:
+        return segmentedDownload(url, dest, segments, progress, sha256)
+    download(url, dest, progress)
+    _verify(dest, None, sha256)
+    return dest
+
+# ---------------- Streaming ----------------
+class _Tee:
+    """ File-like wrapper that copies everything read from `raw` into `sink` """
+
+    def __init__(self, raw, sink, progress=None):
+        self.raw = raw
+        self.sink = sink
+        self.progress = progress
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        if self.sink:
+            self.sink.write(data)
+        if self.progress:
+            self.progress(len(data))
+        return data
+
+def stream(url, dataDir, keep=None, cache=None, progress=None):
+    """
+    Download `url` and extract it into `dataDir` in one pass, overlapping
+    network I/O with decompression. If `keep` is given the archive is also
+    written there (atomically, via `keep.part`).
+    With a `cache`, a cached archive is extracted without touching the network;
+    fresh downloads are never written to it, which would undo the disk savings of streaming.
+    Streams cannot be resumed, so a failed attempt restarts from scratch.
+    """
+    archive = url.split("/")[-1]
+    session = getSession()
+
+    cached = cache.lookup(url) if cache else None
+    if cached and keep:
+        cache.install(url, keep)
+    local = cached or (keep if keep and os.path.exists(keep) else None)
+    if local:
+        with open(local, "rb") as f:
+            return g4data.extractStream(f, dataDir, archive)
+
+    for attempt in range(RETRIES):
+        try:
+            with session.get(url, stream=True, timeout=TIMEOUT) as r:
+                r.raise_for_status()
+                r.raw.decode_content = True
+
+                sink = open(f"{keep}.part", "wb") if keep else None
+                try:
+                    entries = g4data.extractStream(_Tee(r.raw, sink, progress), dataDir, archive)
+                finally:
+                    if sink:
+                        sink.close()
+
+            if keep:
+                os.replace(f"{keep}.part", keep)
+            return entries
+
+        # A connection dropped mid-archive surfaces from urllib3/tarfile, not requests
+        except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError, tarfile.ReadError) as e:
+            status = getattr(e.response, "status_code", None) or 500
+            if attempt == RETRIES - 1 or status < 500:
+                raise
+
+# ---------------- Many files ----------------
+def downloadAll(links, destDir, workers=4, cache=None, progress=None):
+    """
+    Download every link in `links` into `destDir` on a bounded thread pool.
+    Returns the list of (link, exception) pairs that failed.
+    """
+    return _runAll(links, workers,
+                   lambda link: fetch(link, f"{destDir}/{link.split('/')[-1]}", cache, progress))
+
+def streamAll(links, dataDir, workers=4, keepDir=None, cache=None, progress=None):
+    """
+    Stream-extract every link in `links` into `dataDir` on a bounded thread pool,
+    optionally keeping the archives in `keepDir`.
+    Returns the list of (link, exception) pairs that failed.
+    """
+    return _runAll(links, workers,
+                   lambda link: stream(link, dataDir,
+                                       f"{keepDir}/{link.split('/')[-1]}" if keepDir else None,
+                                       cache, progress))
+
+def _runAll(links, workers, fetch):
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(fetch, link): link for link in links}
+
+        for future in as_completed(futures):
+            link = futures[future]
+            try:
+                future.result()
+                print(f"✅ Downloaded {link.split('/')[-1]}")
+            except Exception as e:
+                print(f"❌ ERROR: Failed to download {link.split('/')[-1]}: {e}")
+                failed.append((link, e))
+
+    return failed
@@ -0,0 +1,573 @@
+"""
+g4py/g4gen.py
+- Headless code generation for a Geant4 detector/particle simulation,
+  shared by the g4params dialog and the command line
+"""
+
+import os, sys, csv, json, errno, shutil, hashlib, subprocess, argparse
+from argparse import Namespace
+import tempvars, g4build, g4nist
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+
+# Lines of `{dir}.txt`, in order
+FIELDS = ["dir", "pmt", "particle", "partProp", "partVal", "worldDims", "worldMat", "detDims", "detPVPz",
+          "pmtArray", "overlapPoints"]
+
+# Values of the fields files written before they existed; their PMT cells stay individual placements
+DEFAULTS = {"pmtArray": "Placement", "overlapPoints": "1000"}
+
+# How the PMT cells are represented (see tempvars)
+PMT_ARRAYS = {"Parameterised": tempvars.pmtParameterised,
+              "Replica"      : tempvars.pmtReplica,
+              "Placement"    : tempvars.pmtPlacement}
+
+# Hashes of the files g4gen wrote into a simulation directory
+HASHES = ".g4gen.json"
+
+class Node:
+    __slots__ = ["name", "density", "ratio", "parent", "line"]
+
+    def __init__(self, name, density, ratio, parent="", line=None):
+        self.name = name
+        self.density = density
+        self.ratio = ratio
+        self.parent = parent   # name of the material this is a component of, "" for the root
+        self.line = line       # line of mat.csv, for diagnostics
+
+    def __str__(self):
+        row = f"{self.name},{self.density},{self.ratio},{self.parent}"
+        return f"line {self.line} ({row})" if self.line else f"({row})"
+
+class DAG:
+    """
+    Directed Acyclic Graph of materials: every row is a component of the material
+    (a row with a density) named in its parent field, and one material, the root,
+    has none. Rows can be added and removed one at a time; validation and ordering
+    are iterative (Kahn's algorithm), so deep mixture chains and libraries of
+    100k rows neither hit the recursion limit nor hang on a cycle.
+    """
+
+    def __init__(self, rows=()):
+        self.materials = {}   # name -> material nodes of that name (more than one is an error)
+        self.elements  = {}   # name -> element nodes of that name
+        self.children  = {}   # parent name -> component nodes, whether or not the parent exists yet
+        self.fragments = {}   # material name -> its cached C++ lines
+        self.order     = None
+        for line, (name, density, ratio, parent) in enumerate(rows, 1):
+            node = Node(name, density, ratio, parent, line)
+            (self.materials if density else self.elements).setdefault(name, []).append(node)
+            self.children.setdefault(parent, []).append(node)
+
+    @property
+    def roots(self):
+        return self.children.get("", [])
+
+    @property
+    def root(self):
+        return self.roots[0] if len(self.roots) == 1 else None
+
+    # ---------------- Incremental changes ----------------
+    def _invalidate(self, node):
+        """ Only the fragments of `node` and its parent change; the order only if it is a material (or misplaced) """
+        self.fragments.pop(node.name, None)
+        self.fragments.pop(node.parent, None)
+        if node.density or node.parent not in self.materials:
+            self.order = None
+
+    def add(self, row, line=None):
+        name, density, ratio, parent = row
+        node = Node(name, density, ratio, parent, line)
+        (self.materials if density else self.elements).setdefault(name, []).append(node)
+        self.children.setdefault(parent, []).append(node)
+        self._invalidate(node)
+        return node
+
+    def remove(self, row):
+        name, density, ratio, parent = row
+        for node in self.children.get(parent, []):
+            if (node.name, node.density, node.ratio) == (name, density, ratio):
+                break
+        else:
+            return False
+
+        self.children[parent].remove(node)
+        group = self.materials if density else self.elements
+        group[name].remove(node)
+        if not group[name]:
+            del group[name]
+        self._invalidate(node)
+        return True
+
+    # ---------------- Validation ----------------
+    def _ancestors(self, name):
+        """ Names above material `name`, nearest first, stopping at the root, an unknown name or a repeat """
+        seen = [name]
+        while len(self.materials.get(name, [])) == 1 and self.materials[name][0].parent:
+            name = self.materials[name][0].parent
+            if name in seen:
+                break
+            seen.append(name)
+        return seen
+
+    def check(self, row):
+        """ Problems adding `row` would introduce, without adding it (empty if none) """
+        name, density, ratio, parent = row
+        problems = []
+        if density and name in self.materials:
+            problems.append(f"`{name}` is already defined: {self.materials[name][0]}")
+        if not parent and self.roots:
+            problems.append(f"{self.roots[0]} is already the only material with no parent")
+        elif not parent and not density:
+            problems.append(f"`{name}` is an element, only a material can have no parent")
+        elif parent and parent not in self.materials and parent in self.elements:
+            problems.append(f"`{parent}` is an element, it cannot have components")
+        elif density and parent:
+            chain = self._ancestors(parent)
+            if name in chain:
+                problems.append(f"`{name}` would contain itself: {' -> '.join([name, *chain[:chain.index(name) + 1]])}")
+        return problems
+
+    def problems(self, cycle=None):
+        """ Everything keeping the rows from forming a single tree, naming the rows at fault """
+        problems = []
+        if not self.roots:
+            problems.append("No material has its parent field left blank; exactly one must.")
+        elif len(self.roots) > 1:
+            problems.append("Only one material may have its parent field left blank, not "
+                            + ", ".join(str(node) for node in self.roots))
+        problems += [f"{node} is an element, only a material can have no parent"
+                     for node in self.roots if not node.density]
+        problems += [f"`{name}` is defined more than once: " + ", ".join(str(node) for node in nodes)
+                     for name, nodes in self.materials.items() if len(nodes) > 1]
+
+        for parent, nodes in self.children.items():
+            if not parent or parent in self.materials:
+                continue
+            reason = "is an element, it cannot have components" if parent in self.elements else "is not defined"
+            problems += [f"{node}: parent `{parent}` {reason}" for node in nodes]
+
+        if cycle is None:
+            cycle = self._sort()[1]
+        if cycle:
+            problems.append("Materials contain themselves: " + ", ".join(str(node) for node in cycle))
+        return problems
+
+    # ---------------- Ordering ----------------
+    def _sort(self):
+        """
+        Kahn's algorithm over the materials, components first. Returns the
+        post-order and the materials left over, which lie on cycles.
+        """
+        pending = dict.fromkeys(self.materials, 0)
+        for nodes in self.materials.values():
+            if nodes[0].parent in pending:
+                pending[nodes[0].parent] += 1
+        ready = [nodes[0] for name, nodes in self.materials.items() if not pending[name]]
+        order = []
+        while ready:
+            node = ready.pop()
+            order.append(node)
+            parent = node.parent
+            if parent in pending:
+                pending[parent] -= 1
+                if not pending[parent]:
+                    ready.append(self.materials[parent][0])
+        return order, [nodes[0] for name, nodes in self.materials.items() if pending[name] > 0]
+
+    def traverse(self):
+        """
+        Materials in the order they must be built, each after all of its components.
+        Raises ValueError listing every problem if the rows are not a single tree.
+        """
+        if self.order is None:
+            order, cycle = self._sort()
+            problems = self.problems(cycle)
+            if problems:
+                raise ValueError("\n".join(problems))
+            self.order = order
+        return self.order
+
+    def fragment(self, node):
+        """ C++ building material `node` out of its components, cached until one of its rows changes """
+        if node.name not in self.fragments:
+            lines = [f"    {node.name} = new G4Material(\"{node.name}\", {node.density}*g/cm3, "
+                     f"{len(self.children.get(node.name, []))});\n"]
+            for child in self.children.get(node.name, []):
+                if child.density:
+                    lines.append(f"    {node.name} -> AddMaterial({child.name}, {child.ratio});\n")
+                else:
+                    lines.append(f"    {node.name} -> AddElement(nist -> FindOrBuildElement(\"{child.name}\"), "
+                                 f"{child.ratio});\n")
+            self.fragments[node.name] = "".join(lines)
+        return self.fragments[node.name]
+
+    def code(self):
+        return "".join(self.fragment(node) for node in self.traverse())
+
+# ---------------- Inputs ----------------
+def readParams(path):
+    """ The FIELDS values stored one per line in `path` ({dir}.txt), the missing trailing ones from DEFAULTS """
+    with open(path, "r") as f:
+        values = [line.strip() for line in f]
+    while values and not values[-1]:
+        values.pop()
+    required = len(FIELDS) - len(DEFAULTS)
+    if len(values) < required:
+        raise ValueError(f"`{os.path.basename(path)}` has {len(values)} line(s), expected {required} to {len(FIELDS)}")
+    return values[:len(FIELDS)] + [DEFAULTS[field] for field in FIELDS[len(values):]]
+
+def readMaterials(path):
+    """ Rows of (name, density, ratio, parent) from mat.csv """
+    with open(path, "r") as f:
+        return [row for row in csv.reader(f) if row]
+
+# ---------------- Rendering ----------------
+def checkNames(fields, dag):
+    """ Particle, world material and element names Geant4 would not find at run time (see g4nist) """
+    problems = [g4nist.check("particles", fields[2]),
+                g4nist.check("materials", fields[6]),
+                *(g4nist.check("elements", name) for name in dag.elements)]
+    return [problem for problem in problems if problem]
+
+def render(fields, materials, check=True):
+    """
+    Source files of the simulation as {filename: content}, from mat.csv rows or a DAG
+    of them (whose cached fragments are reused).
+    Raises ValueError if the materials do not form a single tree, a dimension is malformed
+    or (with `check`) a name is unknown to Geant4.
+    """
+    dag = materials if isinstance(materials, DAG) else DAG(materials)
+    problems = checkNames(fields, dag) if check else []
+    if problems:
+        raise ValueError("\n".join(problems))
+    ccstr = dag.code()
+
+    worldDims, detDims = fields[5].split(","), fields[7].split(",")
+    if len(worldDims) != 3 or len(detDims) != 3:
+        raise ValueError("Dimensions must be three comma-separated lengths, e.g. 0.5*m,0.5*m,0.5*m")
+
+    if fields[9] not in PMT_ARRAYS:
+        raise ValueError(f"PMT array must be one of {', '.join(PMT_ARRAYS)}, not `{fields[9]}`")
+    if not fields[10].isdigit():
+        raise ValueError(f"Overlap check points must be a whole number (0 to skip the check), not `{fields[10]}`")
+
+    matList = [f"*{name}" for name in dag.materials]
+    pmt     = fields[1] == "Yes"
+
+    return {
+        "generator.cc"   : tempvars.gencc % (fields[2],
+                                             f"{fields[3]}({fields[4]})"),
+        "construction.cc": tempvars.concc % (fields[6],
+                                             ccstr,
+                                             *worldDims,
+                                             *detDims, fields[8],
+                                             fields[10],
+                                             dag.root.name,
+                                             tempvars.pmt % PMT_ARRAYS[fields[9]] if pmt else "",
+                                             "logicPMT" if pmt else "logicDetector"),
+        "construction.hh": tempvars.conhh % (', ').join(matList),
+    }
+
+# ---------------- Unchanged-content writes ----------------
+def loadHashes(dirPath):
+    try:
+        with open(f"{dirPath}/{HASHES}") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def saveHashes(dirPath, hashes):
+    with open(f"{dirPath}/{HASHES}.tmp", "w") as f:
+        json.dump(hashes, f, indent=4)
+    os.replace(f"{dirPath}/{HASHES}.tmp", f"{dirPath}/{HASHES}")
+
+def _record(path, sha256):
+    stat = os.stat(path)
+    return {"sha256": sha256, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+def _unchanged(path, sha256, size, hashes):
+    """ Whether `path` already holds the `size` bytes hashing to `sha256` """
+    name = os.path.basename(path)
+    entry = hashes.get(name)
+    try:
+        stat = os.stat(path)
+        if entry and (entry["sha256"], entry["size"], entry["mtime"]) == (sha256, stat.st_size, stat.st_mtime_ns):
+            return True
+        if stat.st_size == size:
+            with open(path, "rb") as f:
+                if hashlib.sha256(f.read()).hexdigest() == sha256:
+                    hashes[name] = _record(path, sha256)
+                    return True
+    except OSError:
+        pass
+    return False
+
+def writeIfChanged(path, content, hashes):
+    """
+    Write `content` (str or bytes) to `path` only if it differs from what is there,
+    so make does not rebuild what did not change. `hashes` (from loadHashes) answers
+    without reading the file while its size and mtime still match; edited files
+    are re-hashed. Returns whether the file was written.
+    """
+    data = content.encode() if isinstance(content, str) else content
+    sha256 = hashlib.sha256(data).hexdigest()
+    if _unchanged(path, sha256, len(data), hashes):
+        return False
+
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(data)
+    os.replace(f"{path}.tmp", path)
+    hashes[os.path.basename(path)] = _record(path, sha256)
+    return True
+
+def copyIfChanged(src, dest, hashes, mode="copy"):
+    """ Like writeIfChanged, with the content of `src` placed by cloneFile(`mode`) """
+    with open(src, "rb") as f:
+        sha256 = hashlib.sha256(f.read()).hexdigest()
+    if _unchanged(dest, sha256, os.path.getsize(src), hashes):
+        return False
+
+    if os.path.lexists(f"{dest}.tmp"):
+        os.remove(f"{dest}.tmp")
+    cloneFile(src, f"{dest}.tmp", mode)
+    os.replace(f"{dest}.tmp", dest)
+    hashes[os.path.basename(dest)] = _record(dest, sha256)
+    return True
+
+# ---------------- Cloning ----------------
+CLONE_MODES = ["auto", "reflink", "hardlink", "copy"]
+FICLONE     = 0x40049409   # _IOW(0x94, 9, int) from linux/fs.h
+
+def reflink(src, dest):
+    """ Copy-on-write clone of `src` (Btrfs, XFS, bcachefs, ...); raises OSError where unsupported """
+    if fcntl is None or not sys.platform.startswith("linux"):
+        raise OSError(errno.EOPNOTSUPP, "reflinks are only supported on Linux")
+    with open(src, "rb") as s, open(dest, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dest)
+            raise
+
+def cloneFile(src, dest, mode="auto"):
+    """
+    Place the content of `src` at `dest` without duplicating it on disk where possible:
+    a reflink, else a hardlink if `src` is read-only (so no one can edit it through
+    either name), else a plain copy. `mode` forces one of them, still falling back
+    to a copy. Returns the method used.
+    """
+    if mode in ["auto", "reflink"]:
+        try:
+            reflink(src, dest)
+            return "reflink"
+        except OSError:
+            pass
+    if mode in ["auto", "hardlink"] and not os.stat(src).st_mode & 0o222:
+        try:
+            os.link(src, dest)
+            return "hardlink"
+        except OSError:
+            pass
+    shutil.copyfile(src, dest)
+    return "copy"
+
+# ---------------- Output ----------------
+def cloneDir(srcDir, name, parentDir=None, exist_ok=False, skip=(), mode="auto"):
+    """
+    Directory `name` in `parentDir` (default: next to `srcDir`), created as a clone
+    (see cloneFile) of the files of `srcDir` but those in `skip`, which are about to be
+    generated, unless it is `srcDir` itself.
+    An existing directory is an error unless `exist_ok`, in which case it is refreshed.
+    """
+    srcDir = os.path.abspath(srcDir)
+    parentDir = os.path.abspath(parentDir or os.path.dirname(srcDir))
+    if f"{parentDir}/{name}" == srcDir:
+        return srcDir
+
+    dirPath = f"{parentDir}/{name}"
+    os.makedirs(dirPath, exist_ok=exist_ok)
+
+    # Unchanged files keep their mtime, so a refreshed clone rebuilds only what changed
+    hashes = loadHashes(dirPath)
+    for file in os.listdir(srcDir):
+        if os.path.isfile(f"{srcDir}/{file}") and file not in [HASHES, f"{os.path.basename(srcDir)}.txt", *skip]:
+            copyIfChanged(f"{srcDir}/{file}", f"{dirPath}/{file}", hashes, mode)
+    saveHashes(dirPath, hashes)
+
+    if os.path.isfile(f"{dirPath}/{os.path.basename(srcDir)}.txt"):
+        os.remove(f"{dirPath}/{os.path.basename(srcDir)}.txt")
+
+    return dirPath
+
+def foreignDir(srcDir, name, parentDir=None):
+    """ The path cloneDir would refresh for `name` if it exists but was not written by g4gen, else None """
+    srcDir = os.path.abspath(srcDir)
+    dirPath = f"{os.path.abspath(parentDir or os.path.dirname(srcDir))}/{name}"
+    if dirPath != srcDir and os.path.isdir(dirPath) and not os.path.isfile(f"{dirPath}/{HASHES}"):
+        return dirPath
+    return None
+
+def generate(srcDir, fields, parentDir=None, matPath=None, exist_ok=False, mode="auto", dag=None, check=True):
+    """
+    Render the simulation described by `fields` (FIELDS order) and the mat.csv of `srcDir`
+    (or `matPath`, or an up-to-date `dag` of it) into the directory `fields[0]`, cloning
+    `srcDir` first if it has another name or `parentDir` is elsewhere. Nothing is written
+    if rendering fails (see render for `check`). Returns the directory path.
+    """
+    files = render(fields, dag or readMaterials(matPath or f"{srcDir}/mat.csv"), check)
+
+    # Overridden materials replace mat.csv, and the template's store would not match it
+    skip = [*files, "mat.csv", "mat.db"] if matPath else list(files)
+    dirPath = cloneDir(srcDir, fields[0], parentDir, exist_ok, skip, mode)
+
+    hashes = loadHashes(dirPath)
+    if matPath:
+        copyIfChanged(matPath, f"{dirPath}/mat.csv", hashes)
+    writeIfChanged(f"{dirPath}/{fields[0]}.txt", "".join(f"{field}\n" for field in fields), hashes)
+    for name, content in files.items():
+        writeIfChanged(f"{dirPath}/{name}", content, hashes)
+    saveHashes(dirPath, hashes)
+
+    return dirPath
+
+def compilerCache(dirPath, preferred="auto", maxSize=10):
+    """
+    CMake options and environment that compile `dirPath` through ccache/sccache, in the
+    same cache g4dl uses. Paths are made relative to the parent directory, so sibling
+    variants (and clones) hit each other's objects instead of starting cold.
+    Returns ([], {}) without a compiler cache.
+    """
+    launcher = g4build.findLauncher(preferred)
+    if not launcher:
+        return [], {}
+
+    import g4cache   # pulls in requests, so only when building
+    env = g4build.launcherEnv(launcher, f"{g4cache.DEFAULT_DIR}/{os.path.basename(launcher)}", maxSize,
+                              os.path.dirname(os.path.abspath(dirPath)))
+    return [f"-D{name}={value}" for name, value in g4build.launcherOptions(launcher).items()], env
+
+def buildCommands(dirPath, options=(), jobs=None):
+    """
+    The build directory of the simulation in `dirPath` (created if needed) and the commands
+    that configure it (with extra cmake `options`) and compile it with `jobs` parallel jobs
+    """
+    buildPath = f"{dirPath}/build"
+    if not os.path.exists(buildPath):
+        os.makedirs(buildPath)
+
+    return buildPath, [["cmake", dirPath, *options],
+                       ["make"] + ([f"-j{jobs}"] if jobs else [])]
+
+def build(dirPath, options=(), jobs=None, **kwargs):
+    """
+    Configure and compile the simulation in `dirPath`/build; `kwargs` go to subprocess.run.
+    Returns the first failing exit code.
+    """
+    buildPath, commands = buildCommands(dirPath, options, jobs)
+    for command in commands:
+        returncode = subprocess.run(command, cwd=buildPath, **kwargs).returncode
+        if returncode:
+            return returncode
+    return 0
+
+# ---------------- Command line ----------------
+parser = argparse.ArgumentParser(
+    description="Generate (and build) a Geant4 simulation without the g4params window",
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    epilog="""Examples:
+  python g4gen.py
+      Renders generator.cc and construction.cc/hh from {dir}.txt and mat.csv of the current directory.
+
+  python g4gen.py ~/sims/example_det --build
+      Renders the simulation in ~/sims/example_det, then runs cmake and make in its build directory.
+
+  python g4gen.py --params run42.txt
+      Renders from another parameters file, cloning the directory if it names a new one.
+
+  python g4gen.py --params run42.txt --clone-mode copy
+      Clones with plain copies instead of reflinks/hardlinks.
+
+  python g4gen.py --no-check
+      Renders even if a particle, material or element name is not in the g4nist index.
+"""
+)
+
+parser.add_argument(
+    "dir",
+    nargs="?",
+    default=".",
+    help="Simulation directory holding {dir}.txt and mat.csv (default: current directory)."
+)
+
+parser.add_argument(
+    "--params",
+    type=str,
+    metavar="FILE",
+    help="Parameters file to read instead of {dir}/{dir}.txt."
+)
+
+parser.add_argument(
+    "--build",
+    action="store_true",
+    help="Run cmake and make after generating."
+)
+
+parser.add_argument(
+    "--clone-mode",
+    choices=CLONE_MODES,
+    default="auto",
+    help="How template files reach a new directory (default: auto, a reflink where supported, "
+         "a hardlink for read-only files, else a copy)."
+)
+
+parser.add_argument(
+    "--compiler-cache",
+    choices=["auto"] + g4build.LAUNCHERS + ["off"],
+    default="auto",
+    help="Compiler cache shared with sibling directories when building (default: auto)."
+)
+
+parser.add_argument(
+    "--no-check",
+    action="store_true",
+    help="Do not check particle, material and element names against the g4nist index."
+)
+
+class Args(Namespace):
+    dir: str
+    params: str
+    build: bool
+    clone_mode: str
+    compiler_cache: str
+    no_check: bool
+
+def main():
+    args: Args = parser.parse_args()
+    srcDir = os.path.abspath(os.path.expanduser(args.dir))
+
+    try:
+        fields  = readParams(args.params or f"{srcDir}/{os.path.basename(srcDir)}.txt")
+        # Reruns refresh their own output, but nothing here can confirm overwriting anyone else's
+        foreign = foreignDir(srcDir, fields[0])
+        if foreign:
+            raise ValueError(f"{foreign} exists and was not generated by g4gen; "
+                             "remove it or choose another directory name.")
+        dirPath = generate(srcDir, fields, exist_ok=True, mode=args.clone_mode, check=not args.no_check)
+    except (OSError, ValueError) as e:
+        subprocess.run(["echo", f"❌ ERROR: {e}\n"])
+        sys.exit(1)
+    print(f"✅ Generated {dirPath}\n")
+
+    if args.build:
+        options, env = compilerCache(dirPath, args.compiler_cache)
+        if build(dirPath, options, g4build.autoJobs(), env={**os.environ, **env}):
+            subprocess.run(["echo", f"❌ ERROR: Building {dirPath} failed.\n"])
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+g4py/g4manifest.py
+- Cached JSON manifest of Geant4 releases (source and dataset URLs, sizes,
+  checksums) so that versions resolve without scraping, or fully offline
+"""
+
+import os, json, time, socket, requests
+from bs4 import BeautifulSoup as bs4
+
+HOME_URL     = "https://geant4.web.cern.ch"
+RELEASE_URL  = "https://geant4.web.cern.ch/download/{version}.html"
+DEFAULT_TTL  = 24 * 3600   # seconds before the "latest" version is looked up again
+
+def _parser():
+    # lxml is several times faster than html.parser, which is itself far faster than html5lib
+    try:
+        import lxml   # noqa: F401
+        return "lxml"
+    except ImportError:
+        return "html.parser"
+
+# ---------------- Scraping ----------------
+def scrapeLatest():
+    page = requests.get(HOME_URL, timeout=30)
+    page.raise_for_status()
+    return bs4(page.content, _parser()).find(string="Latest: ").find_next_sibling("a").text.strip()
+
+def scrapeRelease(version):
+    """ Source and dataset URLs from the download page of `version` """
+    page = requests.get(RELEASE_URL.format(version=version), timeout=30)
+    page.raise_for_status()
+    parsed = bs4(page.content, _parser())
+
+    source   = parsed.find(string="Download tar.gz").parent["href"]
+    datasets = parsed.find("h4", {"id": "datasets"}).find_next_sibling("p").find_all("a")
+    return {"source"  : {"url": source},
+            "datasets": [{"url": a["href"]} for a in datasets]}
+
+class Manifest:
+    """
+    Releases already resolved, kept as JSON on disk:
+
+        {"latest"  : {"version": "11.2.1", "checked": <epoch>},
+         "releases": {"11.2.1": {"source"  : {"url", "size", "sha256"},
+                                 "datasets": [{"url", "size", "sha256"}, ...]}}}
+
+    Releases never change once published, so they are kept indefinitely;
+    only the latest version is looked up again after `ttl` seconds.
+    With `offline`, nothing is fetched and the manifest must already know the answer.
+    The file can be copied to (or vendored on) air-gapped build nodes.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, offline=False):
+        self.path = path
+        self.ttl = ttl
+        self.offline = offline
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self.latestEntry = data.get("latest")
+        self.releases = data.get("releases", {})
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.{socket.gethostname()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"latest": self.latestEntry, "releases": self.releases}, f, indent=4)
+        os.replace(tmp, self.path)
+
+    # ---------------- Resolution ----------------
+    def latest(self):
+        """ Latest Geant4 version, from the manifest while it is fresh """
+        fresh = self.latestEntry and time.time() - self.latestEntry["checked"] < self.ttl
+        if fresh or (self.offline and self.latestEntry):
+            return self.latestEntry["version"]
+        if self.offline:
+            raise LookupError(f"The latest Geant4 version is not recorded in {self.path}")
+
+        self.latestEntry = {"version": scrapeLatest(), "checked": time.time()}
+        self._save()
+        return self.latestEntry["version"]
+
+    def release(self, version):
+        """ {"source": {...}, "datasets": [...]} of `version`, scraping it on first use """
+        if version not in self.releases:
+            if self.offline:
+                raise LookupError(f"Geant4 version {version} is not recorded in {self.path}")
+            self.releases[version] = scrapeRelease(version)
+            self._save()
+        return self.releases[version]
+
+    # ---------------- Checksums ----------------
+    def record(self, version, cache):
+        """
+        Copy the size and sha256 of every archive of `version` that `cache`
+        holds into the manifest, so later downloads can be verified.
+        """
+        release = self.releases.get(version)
+        if not release or cache is None:
+            return
+
+        changed = False
+        for entry in [release["source"]] + release["datasets"]:
+            known = cache.entry(entry["url"])
+            if known and (entry.get("sha256"), entry.get("size")) != (known["sha256"], known["size"]):
+                entry.update(sha256=known["sha256"], size=known["size"])
+                changed = True
+        if changed:
+            self._save()
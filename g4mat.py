@@ -0,0 +1,225 @@
+"""
+g4py/g4mat.py
+- Indexed SQLite store of simulation materials, with CSV import and export
+"""
+
+import os, sys, csv, io, sqlite3, socket, hashlib, subprocess, argparse
+from argparse import Namespace
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS materials (
+    id      INTEGER PRIMARY KEY,
+    name    TEXT NOT NULL,
+    density TEXT NOT NULL DEFAULT '',
+    ratio   TEXT NOT NULL DEFAULT '',
+    parent  TEXT NOT NULL DEFAULT '',
+    UNIQUE (name, density, ratio, parent)
+);
+CREATE INDEX IF NOT EXISTS materials_parent ON materials (parent, name);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def _sha256(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+class MaterialStore:
+    """
+    Rows of (name, density, ratio, parent), as in mat.csv.
+
+    Every change is its own transaction, and writers wait up to `timeout` seconds
+    for each other, so several users can edit a shared library. The default
+    rollback journal is kept (not WAL), since WAL needs shared memory that
+    network filesystems do not provide. Lookups by name use the UNIQUE index,
+    listings by parent the (parent, name) index.
+    """
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=timeout)
+        with self.db:
+            self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------------- Queries ----------------
+    def rows(self):
+        """ Every row, ordered by (parent, name) like mat.csv """
+        return [list(row) for row in
+                self.db.execute("SELECT name, density, ratio, parent FROM materials ORDER BY parent, name, id")]
+
+    def contains(self, row):
+        return self.db.execute("SELECT 1 FROM materials WHERE name = ? AND density = ? AND ratio = ? AND parent = ?",
+                               row).fetchone() is not None
+
+    def find(self, name):
+        return [list(row) for row in
+                self.db.execute("SELECT name, density, ratio, parent FROM materials WHERE name = ?", (name,))]
+
+    def children(self, parent):
+        return [list(row) for row in
+                self.db.execute("SELECT name, density, ratio, parent FROM materials WHERE parent = ? ORDER BY name",
+                                (parent,))]
+
+    def parents(self):
+        """ Names usable as a parent: every material (it has a density) and every parent in use """
+        return [name for (name,) in
+                self.db.execute("SELECT parent FROM materials UNION SELECT name FROM materials WHERE density != '' "
+                                "ORDER BY 1")]
+
+    # ---------------- Changes ----------------
+    def add(self, row):
+        """ Insert `row`; returns False if it already exists """
+        with self.db:
+            return self.db.execute("INSERT OR IGNORE INTO materials (name, density, ratio, parent) VALUES (?, ?, ?, ?)",
+                                   row).rowcount == 1
+
+    def remove(self, row):
+        with self.db:
+            return self.db.execute("DELETE FROM materials WHERE name = ? AND density = ? AND ratio = ? AND parent = ?",
+                                   row).rowcount == 1
+
+    # ---------------- CSV ----------------
+    def importCsv(self, path, replace=False):
+        """ Add the rows of a mat.csv (replacing everything if `replace`) in one transaction; returns how many were new """
+        with open(path, "r") as f:
+            rows = [row[:4] + [""] * (4 - len(row)) for row in csv.reader(f) if row]
+        with self.db:
+            if replace:
+                self.db.execute("DELETE FROM materials")
+            return self.db.executemany("INSERT OR IGNORE INTO materials (name, density, ratio, parent) "
+                                       "VALUES (?, ?, ?, ?)", rows).rowcount
+
+    def exportCsv(self, path):
+        """ Write the rows to `path` as mat.csv, atomically and only if its content changes """
+        out = io.StringIO()
+        csv.writer(out).writerows(self.rows())
+        content = out.getvalue()
+
+        try:
+            with open(path, "r", newline="") as f:
+                if f.read() == content:
+                    return False
+        except OSError:
+            pass
+
+        tmp = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+        with open(tmp, "w", newline="") as f:
+            f.write(content)
+        os.replace(tmp, path)
+        return True
+
+    # ---------------- Directory mat.csv ----------------
+    def _synced(self, sha256=None):
+        """ sha256 of the mat.csv the store last matched, recorded if `sha256` is given """
+        if sha256 is None:
+            row = self.db.execute("SELECT value FROM meta WHERE key = 'csv'").fetchone()
+            return row[0] if row else None
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('csv', ?)", (sha256,))
+        return sha256
+
+    def syncCsv(self, path):
+        """
+        Replace the rows with those of the directory's mat.csv at `path` if it changed since
+        the store last matched it (edited by hand, by g4gen or by a sweep). Returns whether it did.
+        """
+        sha256 = _sha256(path)
+        if sha256 is None or sha256 == self._synced():
+            return False
+        self.importCsv(path, replace=True)
+        self._synced(sha256)
+        return True
+
+    def saveCsv(self, path):
+        """
+        Export to the directory's mat.csv at `path`. Raises ValueError instead of overwriting
+        it if it changed since the store last matched it.
+        """
+        sha256 = _sha256(path)
+        if sha256 is not None and sha256 != self._synced():
+            raise ValueError(f"{path} changed since it was loaded; reopen to load it, or move it away to keep "
+                             "the table")
+        changed = self.exportCsv(path)
+        self._synced(_sha256(path))
+        return changed
+
+def openStore(dirPath):
+    """ The material store of a simulation directory, (re)loaded from its mat.csv whenever that changed """
+    store = MaterialStore(f"{dirPath}/mat.db")
+    store.syncCsv(f"{dirPath}/mat.csv")
+    return store
+
+# ---------------- Command line ----------------
+parser = argparse.ArgumentParser(
+    description="Import and export the material store of a simulation",
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    epilog="""Examples:
+  python g4mat.py import library.csv
+      Adds every material of library.csv to ./mat.db.
+
+  python g4mat.py import library.csv --db /shared/materials.db --replace
+      Replaces the shared library with library.csv.
+
+  python g4mat.py export mat.csv
+      Writes ./mat.db as mat.csv, the input of g4gen.
+"""
+)
+
+parser.add_argument(
+    "action",
+    choices=["import", "export"],
+    help="Import a CSV into the store, or export the store as CSV."
+)
+
+parser.add_argument(
+    "csv",
+    help="CSV file of name,density,ratio,parent rows."
+)
+
+parser.add_argument(
+    "--db",
+    default="mat.db",
+    help="Material store (default: mat.db in the current directory)."
+)
+
+parser.add_argument(
+    "--replace",
+    action="store_true",
+    help="With import, drop the existing rows first."
+)
+
+class Args(Namespace):
+    action: str
+    csv: str
+    db: str
+    replace: bool
+
+def main():
+    args: Args = parser.parse_args()
+    try:
+        with MaterialStore(args.db) as store:
+            if args.action == "import":
+                print(f"✅ Imported {store.importCsv(args.csv, args.replace)} material(s) into {args.db}\n")
+            else:
+                store.exportCsv(args.csv)
+                print(f"✅ Exported {len(store.rows())} material(s) to {args.csv}\n")
+    except (OSError, sqlite3.Error) as e:
+        subprocess.run(["echo", f"❌ ERROR: {e}\n"])
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
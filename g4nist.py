@@ -0,0 +1,190 @@
+"""
+g4py/g4nist.py
+- Index of the names Geant4 resolves at run time (NIST elements and materials,
+  particles), so that typos are caught before compiling
+"""
+
+import os, re, sys, json, difflib, subprocess, argparse
+from argparse import Namespace
+
+# Shipped with g4py, and extended per user from Geant4 sources by g4dl (same directory as g4cache)
+INDEX      = os.path.join(os.path.dirname(os.path.abspath(__file__)), "g4nist.json")
+USER_INDEX = os.path.join(os.environ.get("G4PY_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "g4py")),
+                          "g4nist.json")
+
+# What each kind of name is looked up with in the generated C++
+KINDS = {"elements" : "element (FindOrBuildElement)",
+         "materials": "NIST material (FindOrBuildMaterial)",
+         "particles": "particle (FindParticle)"}
+
+# Where the builder finds them in a Geant4 source tree
+SOURCES = {"elements" : ("source/materials/src", r"G4NistElementBuilder\.cc$", r'AddElement\(\s*"([A-Z][a-z]?)"'),
+           "materials": ("source/materials/src", r"G4Nist\w*\.cc$", r'AddMaterial\(\s*"(G4_[^"]+)"'),
+           "particles": ("source/particles", r"G4\w+\.cc$", r'G4String\s+name\s*=\s*"([^"]+)"')}
+
+_index   = None
+_version = None
+
+# ---------------- Loading ----------------
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def load():
+    """ {version: {kind: frozenset}}, the user index taking precedence; read on first use only """
+    global _index
+    if _index is None:
+        versions = {**_read(INDEX), **_read(USER_INDEX)}
+        _index = {version: {kind: frozenset(entry.get(kind, [])) for kind in KINDS}
+                  for version, entry in versions.items()}
+    return _index
+
+def _key(version):
+    return tuple(int(part) for part in re.findall(r"\d+", version)[:2])
+
+def installedVersion():
+    """ Major.minor of the Geant4 on PATH (from geant4-config), or None """
+    global _version
+    if _version is None:
+        try:
+            out = subprocess.run(["geant4-config", "--version"], capture_output=True, text=True).stdout
+        except OSError:
+            out = ""
+        _version = ".".join(out.strip().split(".")[:2])
+    return _version or None
+
+def resolve(version=None):
+    """
+    The indexed version standing in for `version` (default: the installed one):
+    itself, else the newest before it, else the newest of all. None if the index is empty.
+    """
+    versions = sorted(load(), key=_key)
+    if not versions:
+        return None
+    version = version or installedVersion()
+    if not version:
+        return versions[-1]
+    older = [known for known in versions if _key(known) <= _key(version)]
+    return older[-1] if older else versions[-1]
+
+# ---------------- Lookups ----------------
+def names(kind, version=None):
+    """ Every known name of `kind` (a KINDS key) for `version`; empty if nothing is indexed """
+    resolved = resolve(version)
+    return load()[resolved][kind] if resolved else frozenset()
+
+def suggest(kind, name, version=None, n=3):
+    """ Known names of `kind` closest to `name`, ignoring case """
+    known = {candidate.upper(): candidate for candidate in names(kind, version)}
+    return [known[match] for match in difflib.get_close_matches(name.upper(), known, n)]
+
+def check(kind, name, version=None, extra=()):
+    """ None if `name` is a known `kind` (or in `extra`), else a message with suggestions """
+    known = names(kind, version)
+    if not known or name in known or name in extra:
+        return None
+    close = suggest(kind, name, version)
+    return f"Unknown {KINDS[kind]} `{name}`" + (f"; did you mean {', '.join(close)}?" if close else ".")
+
+# ---------------- Building ----------------
+def build(srcDir):
+    """ {kind: sorted names} read from the Geant4 source tree `srcDir` """
+    entry = {}
+    for kind, (subdir, files, pattern) in SOURCES.items():
+        found = set()
+        for dirpath, _, filenames in os.walk(os.path.join(srcDir, subdir)):
+            for file in filenames:
+                if re.search(files, file):
+                    with open(os.path.join(dirpath, file), errors="replace") as f:
+                        found.update(re.findall(pattern, f.read()))
+        entry[kind] = sorted(found)
+    return entry
+
+def record(version, entry, path=USER_INDEX):
+    """ Store `entry` (from build) as major.minor of `version` in the index at `path` """
+    global _index
+    versions = _read(path)
+    versions[".".join(version.split(".")[:2])] = entry
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.{os.getpid()}.tmp", "w") as f:
+        json.dump(versions, f, indent=4, sort_keys=True)
+    os.replace(f"{path}.{os.getpid()}.tmp", path)
+    _index = None
+
+# ---------------- Command line ----------------
+parser = argparse.ArgumentParser(
+    description="Build or query the index of Geant4 element, material and particle names",
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    epilog="""Examples:
+  python g4nist.py build geant4-v11.2.1
+      Indexes the names of an extracted Geant4 11.2.1 source tree into the user index.
+
+  python g4nist.py check materials G4_Water
+      Reports whether G4_Water is a NIST material, with the closest names if not.
+"""
+)
+
+parser.add_argument(
+    "action",
+    choices=["build", "check"],
+    help="Index a Geant4 source tree, or check names against the index."
+)
+
+parser.add_argument(
+    "args",
+    nargs="+",
+    help="build: SOURCE_DIR. check: KIND NAME... with KIND one of elements, materials, particles."
+)
+
+parser.add_argument(
+    "--version",
+    type=str,
+    help="Geant4 version (default: from the source directory name for build, the installed one for check)."
+)
+
+parser.add_argument(
+    "--index",
+    type=str,
+    default=USER_INDEX,
+    help=f"Index written by build (default: {USER_INDEX})."
+)
+
+class Args(Namespace):
+    action: str
+    args: list
+    version: str
+    index: str
+
+def main():
+    args: Args = parser.parse_args()
+
+    if args.action == "build":
+        srcDir = os.path.abspath(os.path.expanduser(args.args[0]))
+        version = args.version or (re.findall(r"\d+\.\d+(?:\.\d+)?", os.path.basename(srcDir)) or [None])[0]
+        if not version:
+            subprocess.run(["echo", f"❌ ERROR: Cannot tell the Geant4 version of {srcDir}, pass --version.\n"])
+            sys.exit(1)
+        entry = build(srcDir)
+        if not all(entry.values()):
+            subprocess.run(["echo", f"❌ ERROR: {srcDir} does not look like a Geant4 source tree.\n"])
+            sys.exit(1)
+        record(version, entry, args.index)
+        print(f"✅ Indexed Geant4 {version}: " + ", ".join(f"{len(entry[kind])} {kind}" for kind in KINDS) + "\n")
+        return
+
+    if args.args[0] not in KINDS or len(args.args) < 2:
+        subprocess.run(["echo", f"❌ ERROR: check takes a kind ({', '.join(KINDS)}) and names.\n"])
+        sys.exit(1)
+    problems = [check(args.args[0], name, args.version) for name in args.args[1:]]
+    problems = [problem for problem in problems if problem]
+    for problem in problems:
+        print(f"❌ {problem}")
+    if problems:
+        sys.exit(1)
+    print(f"✅ Known in Geant4 {resolve(args.version)}\n")
+
+if __name__ == "__main__":
+    main()
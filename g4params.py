@@ -4,70 +4,190 @@ g4py/g4params.py
 """
 
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QLineEdit, QDialogButtonBox, QComboBox, QMessageBox, QScrollArea, QHeaderView,
-                             QTableWidget, QTableWidgetItem, QGroupBox, QWidget, QVBoxLayout, QHBoxLayout, QFormLayout, QPushButton)
+                             QTableView, QGroupBox, QWidget, QVBoxLayout, QHBoxLayout, QFormLayout, QPushButton,
+                             QDialog, QLabel, QPlainTextEdit, QProgressBar, QStyledItemDelegate, QStyle, QStyleOptionButton,
+                             QCompleter, QSpinBox)
 from PyQt5 import QtCore
-import sys, os, shutil, csv, subprocess
+import sys, os, re, bisect
 from pathlib import Path
-import tempvars
+import g4gen, g4build, g4mat, g4nist
 
 absPath  = Path().absolute()
 
-class Node:
-    def __init__(self, name, density, ratio, parent=None):
-        self.name = name
-        self.density = density
-        self.ratio = ratio
-        self.parent = parent
-        self.children = []
+class MaterialsModel(QtCore.QAbstractTableModel):
+    """
+    Rows of the material store (name, density, ratio, parent) held in memory, kept
+    sorted by (parent, name) like mat.csv, with a last column for the remove button.
+    Inserting or removing a row only notifies the views about that row.
+    """
+
+    headers = ["Name", "\u03C1", "Ratio", "Parent", ""]
+
+    def __init__(self, rows, parent=None):
+        super(MaterialsModel, self).__init__(parent)
+        self.rows = sorted(rows, key=self.key)
+        self.keys = [self.key(row) for row in self.rows]
+
+    @staticmethod
+    def key(row):
+        return (row[3], row[0])
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=QtCore.Qt.ItemDataRole.DisplayRole):
+        if role in [QtCore.Qt.ItemDataRole.DisplayRole, QtCore.Qt.ItemDataRole.EditRole] and index.column() < 4:
+            return self.rows[index.row()][index.column()]
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.ItemDataRole.DisplayRole):
+        if orientation == QtCore.Qt.Orientation.Horizontal and role == QtCore.Qt.ItemDataRole.DisplayRole:
+            return self.headers[section]
+        return None
+
+    def insert(self, row):
+        position = bisect.bisect_right(self.keys, self.key(row))
+        self.beginInsertRows(QtCore.QModelIndex(), position, position)
+        self.rows.insert(position, list(row))
+        self.keys.insert(position, self.key(row))
+        self.endInsertRows()
+
+    def remove(self, position):
+        self.beginRemoveRows(QtCore.QModelIndex(), position, position)
+        self.rows.pop(position)
+        self.keys.pop(position)
+        self.endRemoveRows()
+
+class RemoveDelegate(QStyledItemDelegate):
+    """ Paints a "Remove" button in every cell of its column instead of creating a widget per row """
+
+    removeRequested = QtCore.pyqtSignal(QtCore.QModelIndex)
+
+    def paint(self, painter, option, index):
+        button = QStyleOptionButton()
+        button.rect  = option.rect.adjusted(2, 2, -2, -2)
+        button.text  = "Remove"
+        button.state = QStyle.StateFlag.State_Enabled
+        QApplication.style().drawControl(QStyle.ControlElement.CE_PushButton, button, painter)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QtCore.QEvent.Type.MouseButtonRelease and option.rect.contains(event.pos()):
+            self.removeRequested.emit(index)
+            return True
+        return False
+
+
+
+class BuildDialog(QDialog):
+    """ Configures and compiles a generated simulation while the event loop keeps running """
+
+    def __init__(self, dirPath, parent=None):
+        super(BuildDialog, self).__init__(parent)
+        self.setWindowTitle(f"Building {os.path.basename(dirPath)}")
+        self.setAttribute(QtCore.Qt.WidgetAttribute.WA_DeleteOnClose)   # with its QProcess, once closed
+        self.resize(int(width * 0.5), int(height * 0.5))
+
+        self.dialogLayout = QVBoxLayout(self)
+
+        self.status   = QLabel(self)
+        self.progress = QProgressBar(self)
+        self.progress .setRange(0, 100)
+        self.progress .setValue(0)
+        self.log      = QPlainTextEdit(self)
+        self.log      .setReadOnly(True)
+        self.log      .setMaximumBlockCount(10000)   # long builds would otherwise slow the pane down
+        self.closeBtn = QPushButton("Cancel", self)
+        self.closeBtn .clicked.connect(self.cancel)
+
+        for widget in [self.status, self.progress, self.log, self.closeBtn]:
+            self.dialogLayout.addWidget(widget)
+
+        self.jobs = g4build.autoJobs()
+        options, env = g4gen.compilerCache(dirPath)
+        self.buildPath, self.commands = g4gen.buildCommands(dirPath, options, self.jobs)
+        self.partial   = ""
+        self.cancelled = False
+        self.running   = False
+
+        self.process = QtCore.QProcess(self)
+        self.process.setProcessChannelMode(QtCore.QProcess.ProcessChannelMode.MergedChannels)
+        self.process.setWorkingDirectory(self.buildPath)
+        processEnv = QtCore.QProcessEnvironment.systemEnvironment()
+        for name, value in env.items():
+            processEnv.insert(name, value)
+        self.process.setProcessEnvironment(processEnv)
+        self.process.readyReadStandardOutput.connect(self.readOutput)
+        self.process.finished.connect(self.step)
+        self.process.errorOccurred.connect(self.failedToStart)
+
+        self.step()
 
-class DAG:
-    """ Directed Acyclic Graph """
-
-    def __init__(self):
-        self.nodes = {}
-        self.temps = {}
-
-    def add_node(self, node):
-        self.nodes[node.name] = node
+    #----------------------------------------------------------------------
 
-    def add_edge(self, parent_name, node_name):
-        if parent_name in self.nodes:
-            parent = self.nodes[parent_name]
-            child = self.nodes[node_name]
-            parent.children.append(child)
-            child.parent = parent
+    def step(self, exitCode=0, exitStatus=QtCore.QProcess.ExitStatus.NormalExit):
+        """ Start the next command once the previous one succeeded """
+        self.running = False
+        if self.cancelled:
+            return self.finish("Build cancelled.")
+        if exitCode or exitStatus != QtCore.QProcess.ExitStatus.NormalExit:
+            return self.finish(f"Build failed: `{self.process.program()}` exited with status {exitCode}.")
+        if not self.commands:
+            self.progress.setValue(100)
+            return self.finish("Build complete.")
+
+        command = self.commands.pop(0)
+        self.status.setText("Configuring with CMake..." if command[0] == "cmake"
+                            else f"Compiling with {self.jobs} parallel job(s)...")
+        self.log.appendPlainText(f"$ {' '.join(command)}")
+        self.running = True
+        self.process.start(command[0], command[1:])
+
+    def failedToStart(self, error):
+        if error == QtCore.QProcess.ProcessError.FailedToStart:
+            self.running = False
+            self.finish(f"Build failed: `{self.process.program()}` could not be started.")
+
+    def finish(self, message):
+        self.commands = []
+        self.status.setText(message)
+        self.closeBtn.setText("Close")
 
-        elif len(parent_name):
-            if parent_name in self.temps:
-                self.temps[parent_name].append(self.nodes[node_name])
-            else:
-                self.temps[parent_name] = [self.nodes[node_name]]
+    #----------------------------------------------------------------------
 
-        if node_name in self.temps:
-            parent = self.nodes[node_name]
-            for child in self.temps[node_name]:
-                parent.children.append(child)
-                child.parent = parent
+    def readOutput(self):
+        text = self.partial + bytes(self.process.readAllStandardOutput()).decode(errors="replace")
+        *lines, self.partial = text.split("\n")
 
-    def traverse(self):
-        traversal_order = []
+        for line in lines:
+            self.log.appendPlainText(line)
+            # make prints "[ 42%] Building CXX object ..."
+            match = re.match(r"\[\s*(\d+)%\]", line)
+            if match:
+                self.progress.setValue(int(match.group(1)))
 
-        def dfs(node):
-            for child in node.children:
-                dfs(child)
-            traversal_order.append(node)
+    #----------------------------------------------------------------------
 
-        n = 0
-        for node in self.nodes:
-            if not self.nodes[node].parent:
-                self.start_node = self.nodes[node]
-                n += 1
+    def cancel(self):
+        if not self.running:
+            return self.close()
+        self.cancelled = True
+        self.status.setText("Cancelling...")
+        self.process.terminate()
+        QtCore.QTimer.singleShot(3000, self.process.kill)
 
-        if n != 1:
-            return None
+    def reject(self):
+        # Escape would only hide the dialog and leave make running
+        self.close()
 
-        dfs(self.start_node)
-        return traversal_order[::-1]
+    def closeEvent(self, event):
+        if self.running:
+            self.cancelled = True
+            self.process.kill()
+            self.process.waitForFinished(3000)
+        event.accept()
 
 
 
@@ -75,6 +195,7 @@ class G4PY(QMainWindow):
     def __init__(self):
         super(G4PY, self).__init__(parent=None)
         self.setWindowTitle("Geant4 Params")
+        self.buildDialog = None
 
         self.centralWidget = QScrollArea(self)
         self.centralWidget.setVerticalScrollBarPolicy  (QtCore.Qt.ScrollBarPolicy.ScrollBarAlwaysOn)
@@ -86,17 +207,14 @@ class G4PY(QMainWindow):
         self.paramsLayout = QVBoxLayout(self.paramsWidget)
         self.centralWidget.setWidget(self.paramsWidget)
 
-        self.values = []
+        # Files from before the newer fields get their defaults
         try:
-            with open(f"{absPath}/{absPath.name}.txt", "r") as f:
-                for line in f:
-                    self.values.append(line.strip())
-        except:
+            self.values = g4gen.readParams(f"{absPath}/{absPath.name}.txt")
+        except OSError:
             QMessageBox.critical(self, "Error", f"`{absPath.name}.txt` not found")
             sys.exit(self.close())
-
-        if not len(self.values):
-            QMessageBox.critical(self, "Error", "Template data not available.")
+        except ValueError as e:
+            QMessageBox.critical(self, "Error", f"Template data not available: {e}")
             sys.exit(self.close())
 
         #------------------------------------------------------------------
@@ -117,8 +235,23 @@ class G4PY(QMainWindow):
         self.dir  .setText       (self.values[0])
         self.pmt  .setCurrentText(self.values[1])
 
-        labels0 = ["Directory name", "Do you need PMTs?"]
-        fields0 = [self.dir, self.pmt]
+        # Replicas and parameterised cells are one volume to the navigator, placements one per cell
+        self.pmtArray = QComboBox(self.groupbox0)
+        self.pmtArray .addItems(list(g4gen.PMT_ARRAYS))
+        self.pmtArray .setCurrentText(self.values[9])
+        self.pmtArray .setEnabled(self.pmt.currentText() == "Yes")
+        self.pmt.currentTextChanged.connect(lambda text: self.pmtArray.setEnabled(text == "Yes"))
+
+        self.overlapPoints = QSpinBox(self.groupbox0)
+        self.overlapPoints .setRange(0, 1000000)
+        self.overlapPoints .setSingleStep(100)
+        self.overlapPoints .setSpecialValueText("Off")
+        self.overlapPoints .setValue(int(self.values[10]) if self.values[10].isdigit() else 0)
+        self.overlapPoints .setToolTip("Points sampled per volume when checking overlaps. Every placed PMT "
+                                       "is checked; replicated and parameterised arrays only as a whole.")
+
+        labels0 = ["Directory name", "Do you need PMTs?", "PMT array", "Overlap check points"]
+        fields0 = [self.dir, self.pmt, self.pmtArray, self.overlapPoints]
 
         for i in range(len(fields0)):
             self.groupbox0Layout.addRow(labels0[i], fields0[i])
@@ -231,18 +364,47 @@ class G4PY(QMainWindow):
         self.groupbox5Layout = QFormLayout(self.groupbox5)
         self.widget2Layout.addWidget(self.groupbox5)
 
-        labels5 = ["Name", "\u03C1", "Ratio", "Parent", ""]
-
-        self.emtable = QTableWidget(0, len(labels5), self.groupbox4)
-        self.emtable.setHorizontalHeaderLabels(labels5)
+        # Edits go to the indexed store; mat.csv is exported from it for code generation
+        self.store = g4mat.openStore(absPath)
+
+        self.emmodel = MaterialsModel(self.store.rows(), self)
+        self.parents.update(self.store.parents())
+
+        # Checks each new row as it is added and keeps the generated code of untouched materials
+        self.emdag = g4gen.DAG()
+        for row in self.emmodel.rows:
+            self.emdag.add(row)
+
+        # Names Geant4 resolves at run time. The world is looked up before the table's materials
+        # are built, so it must be a NIST material.
+        self.checkNames(self.particle, "particles")
+        self.checkNames(self.worldMat, "materials")
+        self.checkNames(self.emname  , "elements")
+
+        # Sorting and filtering happen in the proxy; the model keeps the file order
+        self.emproxy = QtCore.QSortFilterProxyModel(self)
+        self.emproxy.setSourceModel(self.emmodel)
+        self.emproxy.setFilterKeyColumn(-1)
+        self.emproxy.setFilterCaseSensitivity(QtCore.Qt.CaseSensitivity.CaseInsensitive)
+
+        self.emfilter = QLineEdit(self.groupbox5)
+        self.emfilter.setPlaceholderText("Filter")
+        self.emfilter.textChanged.connect(self.emproxy.setFilterFixedString)
+        self.groupbox5Layout.addWidget(self.emfilter)
+
+        self.emremove = RemoveDelegate(self)
+        self.emremove.removeRequested.connect(self.removeFromTable)
+
+        self.emtable = QTableView(self.groupbox5)
+        self.emtable.setModel(self.emproxy)
+        self.emtable.setItemDelegateForColumn(4, self.emremove)
+        self.emtable.setSortingEnabled(True)
+        self.emtable.sortByColumn(-1, QtCore.Qt.SortOrder.AscendingOrder)   # file order until a header is clicked
         self.emtable.horizontalHeader().setStretchLastSection(True)
         self.emtable.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.emtable.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)   # no per-row measuring
         self.groupbox5Layout.addWidget(self.emtable)
 
-        with open(f"{absPath}/mat.csv", "r") as f:
-            readCSV = list(csv.reader(f))
-        self.makeTable(readCSV)
-
         self.emparent.addItems(self.parents)
 
         #------------------------------------------------------------------
@@ -256,6 +418,28 @@ class G4PY(QMainWindow):
 
     #----------------------------------------------------------------------
 
+    def checkNames(self, widget, kind):
+        """ Complete `widget` from the g4nist names of `kind` and flag unknown names as they are typed """
+        completer = QCompleter(sorted(g4nist.names(kind)), widget)
+        completer.setCaseSensitivity(QtCore.Qt.CaseSensitivity.CaseInsensitive)
+        completer.setFilterMode(QtCore.Qt.MatchFlag.MatchContains)
+        widget.setCompleter(completer)
+
+        def check(text):
+            # Element names only matter while adding an element
+            message = None if widget is self.emname and self.em.currentIndex() else g4nist.check(kind, text)
+            widget.setToolTip(message or "")
+            widget.setProperty("unknown", bool(message))
+            widget.style().unpolish(widget)
+            widget.style().polish(widget)
+
+        widget.textChanged.connect(check)
+        if widget is self.emname:
+            self.em.currentIndexChanged.connect(lambda: check(widget.text()))
+        check(widget.text())
+
+    #----------------------------------------------------------------------
+
     def emset(self):
         if self.em.currentIndex():
             self.emdensity = QLineEdit("1.000", self.groupbox4)
@@ -266,155 +450,68 @@ class G4PY(QMainWindow):
 
     #----------------------------------------------------------------------
 
-    def makeTable(self, readCSV):
-        self.emtable.setRowCount(len(readCSV))
-
-        for i in range(len(readCSV)):
-            for j in range(4):
-                self.emtable.setItem(i, j, QTableWidgetItem(readCSV[i][j]))
-            self.parents.add(readCSV[i][3])
-
-            removeBtn = QPushButton("Remove", self.emtable)
-            removeBtn.clicked.connect(lambda _, row=i: self.removeFromTable(row))
-            self.emtable.setCellWidget(i, 4, removeBtn)
-
-    #----------------------------------------------------------------------
-
     def addToTable(self):
-        with open(f"{absPath}/mat.csv", "r") as f:
-            readCSV = list(csv.reader(f))
-
         data =  [self.emname   .       text(),
                  self.emdensity.       text(),
                  self.emratio  .       text(),
                  self.emparent .currentText()]
 
-        if data in readCSV:
-            QMessageBox.critical(self, "Error", "Material already exists.")
+        problems = self.emdag.check(data)
+        if problems:
+            QMessageBox.critical(self, "Error", "\n".join(problems))
             return
 
-        readCSV.append(data)
-        readCSV = sorted(readCSV, key=lambda x: [x[-1], x[0]])
-
-        self.makeTable(readCSV)
+        if not self.store.add(data):
+            QMessageBox.critical(self, "Error", "Material already exists.")
+            return
 
-        writeCSV = csv.writer(open(f"{absPath}/mat.csv", "w"))
-        writeCSV.writerows(readCSV)
+        self.emmodel.insert(data)
+        self.emdag.add(data)
 
         if self.em.currentIndex(): self.emparent.addItem(self.emname.text())
 
     #----------------------------------------------------------------------
 
-    def removeFromTable(self, row):
-        with open(f"{absPath}/mat.csv", "r") as f:
-            readCSV = list(csv.reader(f))
-
-        readCSV.pop(row)
-        readCSV = sorted(readCSV, key=lambda x: (x[-1], x[0]))
-
-        self.makeTable(readCSV)
-
-        writeCSV = csv.writer(open(f"{absPath}/mat.csv", "w"))
-        writeCSV.writerows(readCSV)
+    def removeFromTable(self, index):
+        row = self.emproxy.mapToSource(index).row()
+        self.store.remove(self.emmodel.rows[row])
+        self.emdag.remove(self.emmodel.rows[row])
+        self.emmodel.remove(row)
 
     #----------------------------------------------------------------------
 
     def accept(self):
+        # Regenerating would change the sources under the running make
+        if self.buildDialog and self.buildDialog.running:
+            self.buildDialog.raise_()
+            QMessageBox.critical(self, "Error", "A build is still running; cancel it or wait for it to finish.")
+            return
+
         fields = [self.dir      .text(), self.pmt     .currentText(),
                   self.particle .text(), self.partProp.currentText(), self.partVal.text(),
                   self.worldDims.text(), self.worldMat.text(),
-                  self.detDims  .text(), self.detPVPz .text()]
-
-        try:
-            if absPath.name != fields[0]:
-                dirPath = f"{os.path.dirname(absPath)}/{fields[0]}"
-                os.makedirs(dirPath)
-
-                for file in os.listdir(f"{absPath}"):
-                    if os.path.isfile(f"{absPath}/{file}"):
-                        shutil.copyfile(f"{absPath}/{file}", f"{dirPath}/{file}")
-
-                if os.path.isfile(f"{dirPath}/{absPath.name}.txt"):
-                    os.remove(f"{dirPath}/{absPath.name}.txt")
-
-            else:
-                dirPath = absPath
-
-            with open(f"{dirPath}/{fields[0]}.txt", 'w') as file:
-                for field in fields:
-                    file.write(f"{field}\n")
-
-            #**************************************** CREATE FILE generator.cc ****************************************
-
-            with open(f"{dirPath}/generator.cc", "w") as genccfile:
-                genccfile.write(tempvars.gencc % (fields[2],
-                                                    f"{fields[3]}({fields[4]})"))
-
-            #************************************** CREATE FILE construction.cc ***************************************
-
-            with open(f"{dirPath}/construction.cc", "w") as conccfile:
-
-                with open(f"{dirPath}/mat.csv", "r") as matfile:
-                    readCSV = list(csv.reader(matfile))
-
-                # Create the DAG and populate it with nodes and edges
-                dag = DAG()
-                for row in readCSV:
-                    name, density, ratio, parent = row
-                    node = Node(name, density, ratio)
-                    dag.add_node(node)
-                    dag.add_edge(parent, name)
-
-                # Use the DAG to generate the output code
-                traversal_order = dag.traverse()
-                if not traversal_order:
-                    QMessageBox.critical(self, "Error", "Please configure only 1 material with parent field left blank.")
-                    return
+                  self.detDims  .text(), self.detPVPz .text(),
+                  self.pmtArray .currentText(), str(self.overlapPoints.value())]
 
-                matList = set()
-                ccstr   = ""
-
-                for node in traversal_order:
-                    if len(node.density):
-                        matList.add(f"*{node.name}")
-
-                        ccstr     += f"    {node.name} = new G4Material(\"{node.name}\", {node.density}*g/cm3, {len(node.children)});\n"
-
-                        if node.parent:
-                            ccstr += f"    {node.parent.name} -> AddMaterial({node.name}, {node.ratio});\n"
-
-                    else:
-                        ccstr     += f"    {node.parent.name} -> AddElement(nist -> FindOrBuildElement(\"{node.name}\"), {node.ratio});\n"
-
-                conccfile.write(tempvars.concc % (self.worldMat.text(),
-                                                    ccstr,
-                                                    *fields[5].split(","),
-                                                    *fields[7].split(","), fields[8],
-                                                    dag.start_node.name,
-                                                    tempvars.pmt if fields[1] else "",
-                                                    "logicPMT" if fields[1] else "logicDetector"))
-
-            #************************************** CREATE FILE construction.hh ***************************************
-
-            with open(f"{dirPath}/construction.hh", "w") as conhhfile:
-                conhhfile.write(tempvars.conhh % (', ').join(matList))
-
-            #**********************************************************************************************************
-
-            self.close()
-
-            buildPath = f"{dirPath}/build"
-            if not os.path.exists(buildPath):
-                os.makedirs(buildPath)
-            os.chdir(buildPath)
-
-            subprocess.run(["cmake", dirPath])
-            subprocess.run(["make"])
+        # A directory g4gen did not write may hold someone's own files
+        foreign = g4gen.foreignDir(absPath, fields[0])
+        if foreign and QMessageBox.question(self, "Overwrite", f"{foreign} already exists. Overwrite its files?") \
+                != QMessageBox.StandardButton.Yes:
+            return
 
-        except OSError as e:
+        try:
+            self.store.saveCsv(f"{absPath}/mat.csv")
+            dirPath = g4gen.generate(absPath, fields, exist_ok=True, dag=self.emdag)
+        except (OSError, ValueError) as e:
             QMessageBox.critical(self, "Error", f"{e}")
             return
 
+        # The window stays open and editable for the next edit-build-run iteration
+        dialog = BuildDialog(dirPath, self)
+        dialog.destroyed.connect(lambda: setattr(self, "buildDialog", None) if self.buildDialog is dialog else None)
+        self.buildDialog = dialog
+        self.buildDialog.show()
+
 
 
 app = QApplication(sys.argv)
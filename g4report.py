@@ -0,0 +1,108 @@
+"""
+g4py/g4report.py
+- Phase timings, transfer volumes and the JSON run report of g4dl
+"""
+
+import os, sys, json, time, platform, threading
+from contextlib import contextmanager
+
+def _cpuTime():
+    # Includes reaped child processes: cmake, make, tar and the extraction pool
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+class Report:
+    """
+    Wall-clock and CPU time, bytes and throughput for each installer phase.
+
+    CPU time is process-wide, so phases that overlap are each charged for
+    the CPU used while they were running.
+    """
+
+    def __init__(self, path, live=False, **meta):
+        self.path = path
+        self.meta = {"host"   : platform.node(),
+                     "system" : platform.system(),
+                     "machine": platform.machine(),
+                     "python" : platform.python_version(),
+                     "cpus"   : os.cpu_count(),
+                     **meta}
+        self.phases = {}
+        self.status = "failed"
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.active = []
+
+        if live and sys.stderr.isatty():
+            threading.Thread(target=self._live, daemon=True).start()
+
+    @contextmanager
+    def phase(self, name):
+        entry = self.phases.setdefault(name, {"wall": 0.0, "cpu": 0.0, "bytes": 0})
+        wall, cpu = time.perf_counter(), _cpuTime()
+        entry["start"] = entry.get("start", round(time.time() - self.started, 3))
+        with self.lock:
+            self.active.append(name)
+        try:
+            yield entry
+        finally:
+            with self.lock:
+                self.active.remove(name)
+            entry["wall"] += time.perf_counter() - wall
+            entry["cpu"]  += _cpuTime() - cpu
+
+    def counter(self, name):
+        """ Callback adding transferred bytes to phase `name` (safe to call from worker threads) """
+        def add(n):
+            with self.lock:
+                self.phases.setdefault(name, {"wall": 0.0, "cpu": 0.0, "bytes": 0})["bytes"] += n
+        return add
+
+    def skip(self, name):
+        """ Record that phase `name` was already complete and did not run """
+        self.phases.setdefault(name, {"wall": 0.0, "cpu": 0.0, "bytes": 0})["skipped"] = True
+
+    # ---------------- Output ----------------
+    def summary(self):
+        phases = {}
+        for name, entry in self.phases.items():
+            phases[name] = {**entry,
+                            "wall": round(entry["wall"], 3),
+                            "cpu" : round(entry["cpu"] , 3)}
+            if entry["bytes"] and entry["wall"]:
+                phases[name]["throughput"] = round(entry["bytes"] / entry["wall"])
+        return {**self.meta,
+                "status": self.status,
+                "wall"  : round(time.time() - self.started, 3),
+                "phases": phases}
+
+    def write(self):
+        if not self.path:
+            return
+
+        summary = self.summary()
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(summary, f, indent=4)
+        os.replace(f"{self.path}.tmp", self.path)
+
+        print(f"\n⏱  {'Phase':<18}{'Wall (s)':>10}{'CPU (s)':>10}{'MB':>10}{'MB/s':>8}")
+        for name, entry in summary["phases"].items():
+            print(f"   {name:<18}{entry['wall']:>10.1f}{entry['cpu']:>10.1f}"
+                  f"{entry['bytes'] / 1e6:>10.1f}{entry.get('throughput', 0) / 1e6:>8.1f}")
+        print(f"   Report written to {self.path}\n")
+
+    def _live(self):
+        last = {}
+        while True:
+            time.sleep(1)
+            with self.lock:
+                active = list(self.active)
+            parts = []
+            for name in active:
+                entry = self.phases[name]
+                rate = (entry["bytes"] - last.get(name, entry["bytes"])) / 1e6
+                last[name] = entry["bytes"]
+                parts.append(f"{name} {entry['bytes'] / 1e6:.0f} MB {rate:.1f} MB/s" if entry["bytes"] else name)
+            if parts:
+                sys.stderr.write(f"\r⏱  {time.time() - self.started:6.0f}s  " + " | ".join(parts) + "\033[K")
+                sys.stderr.flush()
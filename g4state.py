@@ -0,0 +1,165 @@
+"""
+g4py/g4state.py
+- Checkpointed installer phases that resume at the first incomplete one,
+  scheduled concurrently along their dependency graph
+"""
+
+import os, sys, json, time, threading, traceback
+
+class Phase:
+    """
+    One resumable step of the installation.
+
+    name    : key in the state file and the run report
+    run     : callable doing the work; it exits the program on failure
+    deps    : names of phases whose rerun invalidates this one
+    inputs  : JSON-serialisable dict (or callable returning one, evaluated once
+              the deps have run) that must match the recorded value to skip
+    outputs : paths that must still exist to skip
+    uses    : resource budget held while running, e.g. {"net": 1, "cpu": 6}
+    """
+
+    def __init__(self, name, run, deps=(), inputs=None, outputs=(), uses=None):
+        self.name = name
+        self.run = run
+        self.deps = list(deps)
+        self.inputs = inputs
+        self.outputs = list(outputs)
+        self.uses = dict(uses or {})
+
+    def currentInputs(self):
+        inputs = self.inputs() if callable(self.inputs) else self.inputs
+        # Round-trip so that tuples etc. compare equal to what was loaded from disk
+        return json.loads(json.dumps(inputs or {}))
+
+class State:
+    """ Completed phases and their inputs, kept as JSON inside the install root """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.phases = json.load(f)["phases"]
+        except (OSError, ValueError, KeyError):
+            self.phases = {}
+
+    def isDone(self, name, inputs):
+        return name in self.phases and self.phases[name]["inputs"] == inputs
+
+    def mark(self, name, inputs):
+        self.phases[name] = {"inputs": inputs, "finished": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        self._save()
+
+    def clear(self, name):
+        if self.phases.pop(name, None) is not None:
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump({"phases": self.phases}, f, indent=4)
+        os.replace(f"{self.path}.tmp", self.path)
+
+def isStale(phase, state, rerun, inputs):
+    """ Whether `phase` has to run, given the phases that already `rerun` this time """
+    return (not state.isDone(phase.name, inputs)
+            or phase.name in rerun
+            or any(dep in rerun for dep in phase.deps)
+            or not all(os.path.exists(path) for path in phase.outputs))
+
+def runPhases(phases, state, report, redo=(), budget=None, concurrent=True):
+    """
+    Run `phases` (listed in dependency order), skipping every phase that
+    completed with the same inputs and whose dependencies did not rerun.
+    A phase is unmarked before it starts, so a crash midway reruns it next time.
+
+    Phases whose dependencies are done start on their own thread as soon as
+    their `uses` fit in what is left of `budget` ({"net": 1, "cpu": 8, ...});
+    earlier phases in the list get first pick. With `concurrent=False` they
+    run one at a time. Exits with status 1 once everything that could run
+    has finished, if any phase failed. Returns the names of the phases that
+    reran (plus `redo`), to pass as `redo` when running their dependents later.
+    """
+    budget  = dict(budget or {})
+    pending = list(phases)
+    running = set()
+    done    = set()
+    failed  = set()
+    rerun   = set(redo)
+    # Dependencies left out of `phases` are taken as done: they cannot rerun this time
+    scheduled = {phase.name for phase in phases}
+    lock    = threading.Condition()
+
+    def fits(phase):
+        # Anything may run alone, even if it asks for more than the whole budget
+        if not running:
+            return True
+        if not concurrent:
+            return False
+        return all(amount <= budget.get(resource, amount) for resource, amount in phase.uses.items())
+
+    def hold(phase, sign):
+        for resource, amount in phase.uses.items():
+            if resource in budget:
+                budget[resource] -= sign * amount
+
+    def work(phase, inputs):
+        ok = False
+        try:
+            with report.phase(phase.name):
+                phase.run()
+            ok = True
+        except SystemExit:
+            pass   # the phase already reported its error
+        except BaseException:
+            traceback.print_exc()
+
+        with lock:
+            hold(phase, -1)
+            running.discard(phase.name)
+            if ok:
+                state.mark(phase.name, inputs)
+                rerun.add(phase.name)
+                done.add(phase.name)
+            else:
+                failed.add(phase.name)
+            lock.notify_all()
+
+    with lock:
+        while pending or running:
+            started = False
+
+            for phase in list(pending):
+                if any(dep in failed for dep in phase.deps):
+                    print(f"⛔ Not running {phase.name}: a phase it depends on failed\n")
+                    pending.remove(phase)
+                    failed.add(phase.name)
+                    started = True
+                    continue
+                if not all(dep in done or dep not in scheduled for dep in phase.deps):
+                    continue
+
+                inputs = phase.currentInputs()
+                if not isStale(phase, state, rerun, inputs):
+                    print(f"⏭  Skipping {phase.name} (already done)\n")
+                    report.skip(phase.name)
+                    pending.remove(phase)
+                    done.add(phase.name)
+                    started = True
+                    continue
+                if not fits(phase):
+                    continue
+
+                state.clear(phase.name)
+                hold(phase, +1)
+                running.add(phase.name)
+                pending.remove(phase)
+                threading.Thread(target=work, args=(phase, inputs), name=phase.name, daemon=True).start()
+                started = True
+
+            if not started:
+                lock.wait()
+
+    if failed:
+        sys.exit(1)
+    return rerun
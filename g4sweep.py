@@ -0,0 +1,243 @@
+"""
+g4py/g4sweep.py
+- Parameter sweeps: many simulation variants generated from one template
+  directory and built in parallel through a shared compiler cache
+"""
+
+import os, sys, json, itertools, subprocess, argparse, multiprocessing
+from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import g4gen, g4build, g4cache
+
+# ---------------- Spec ----------------
+def expand(spec, base="variant"):
+    """
+    Variants of a sweep spec as [(name, overrides)], where overrides maps FIELDS
+    (and "materials", a mat.csv path) to values:
+
+        {"grid"  : {"particle": ["proton", "e-"], "partVal": ["1.*GeV", "10.*GeV"]},
+         "points": [{"worldMat": "G4_AIR"}, {"worldMat": "G4_WATER", "materials": "water.csv"}]}
+
+    Every grid combination is applied to every point (either may be left out).
+    A point may name its variants with "dir" (numbered `{dir}-NNN` if the grid has
+    several combinations); the others are numbered `{base}-NNN`.
+    """
+    grid   = spec.get("grid", {})
+    points = spec.get("points", [{}]) or [{}]
+
+    if not isinstance(grid, dict) or not all(isinstance(point, dict) for point in points):
+        raise ValueError("A sweep spec has a \"grid\" object and/or a \"points\" list of objects")
+
+    for key in set(grid).union(*points):
+        if key not in g4gen.FIELDS and key != "materials":
+            raise ValueError(f"Unknown sweep parameter `{key}`; expected one of {', '.join(g4gen.FIELDS)}, materials")
+
+    # Fields are written one per line, so numbers are taken as written and nothing else is allowed
+    def scalar(key, value):
+        if isinstance(value, (list, dict)) or value is None:
+            raise ValueError(f"Sweep parameter `{key}` must be a string or a number, not {json.dumps(value)}")
+        return str(value)
+
+    for key, values in grid.items():
+        if not isinstance(values, list):
+            raise ValueError(f"Grid parameter `{key}` must be a list of values")
+    grid   = {key: [scalar(key, value) for value in values] for key, values in grid.items()}
+    points = [{key: scalar(key, value) for key, value in point.items()} for point in points]
+
+    combos = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    variants = []
+    for point in points:
+        for i, combo in enumerate(combos):
+            overrides = {**point, **combo}
+            name = overrides.pop("dir", None)
+            if not name:
+                name = f"{base}-{len(variants):03d}"
+            elif len(combos) > 1:
+                name = f"{name}-{i:03d}"
+            variants.append((name, overrides))
+
+    names = [name for name, _ in variants]
+    if len(set(names)) != len(names):
+        raise ValueError("Variant directory names must be unique")
+    return variants
+
+# ---------------- Variants ----------------
+def findExecutables(buildDir):
+    """ Executables that make left at the top of `buildDir` """
+    try:
+        return sorted(f"{buildDir}/{file}" for file in os.listdir(buildDir)
+                      if os.path.isfile(f"{buildDir}/{file}") and os.access(f"{buildDir}/{file}", os.X_OK))
+    except OSError:
+        return []
+
+def runVariant(srcDir, outDir, fields, matPath=None, build=True, options=(), jobs=1):
+    """ Generate (and build) one variant; returns its manifest entry """
+    entry = {"name": fields[0], "dir": f"{outDir}/{fields[0]}", "fields": dict(zip(g4gen.FIELDS, fields)),
+             "materials": matPath, "status": "generated", "executable": None}
+    try:
+        # Rerunning a sweep regenerates its variants in place and rebuilds incrementally
+        g4gen.generate(srcDir, fields, outDir, matPath, exist_ok=True)
+    except (OSError, ValueError) as e:
+        return {**entry, "status": "failed", "error": str(e)}
+
+    if build:
+        with open(f"{entry['dir']}/build.log", "w") as log:
+            failed = g4gen.build(entry["dir"], options, jobs, stdout=log, stderr=subprocess.STDOUT)
+        if failed:
+            return {**entry, "status": "failed", "error": f"build failed, see {entry['dir']}/build.log"}
+        executables = findExecutables(f"{entry['dir']}/build")
+        entry.update(status="built", executable=executables[0] if executables else None)
+
+    return entry
+
+def sweep(srcDir, spec, outDir, workers=None, build=True, launcher=None, specDir="."):
+    """
+    Generate every variant of `spec` from the template `srcDir` into `outDir` and build
+    them on a process pool of `workers`, each compiling with one job, through the
+    compiler cache `launcher` if given. Writes and returns the manifest {outDir}/sweep.json.
+    """
+    srcDir, outDir = os.path.abspath(srcDir), os.path.abspath(outDir)
+    base = g4gen.readParams(f"{srcDir}/{os.path.basename(srcDir)}.txt")
+
+    variants = expand(spec, os.path.basename(srcDir))
+    if not variants:
+        raise ValueError("The sweep spec has no variants (is a grid parameter given an empty list?)")
+    os.makedirs(outDir, exist_ok=True)
+
+    options = [f"-D{name}={value}" for name, value in g4build.launcherOptions(launcher).items()] if launcher else []
+    for i, (name, overrides) in enumerate(variants):
+        fields = [overrides.get(field, value) for field, value in zip(g4gen.FIELDS, base)]
+        fields[0] = name
+        matPath = os.path.abspath(os.path.join(specDir, overrides["materials"])) if "materials" in overrides else None
+        variants[i] = (fields, matPath)
+
+    entries = []
+    # Spawned, not forked, like the extraction pool of g4data
+    with ProcessPoolExecutor(max_workers=min(len(variants), workers or g4build.availableCpus()),
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(runVariant, srcDir, outDir, fields, matPath, build, options): (fields, matPath)
+                   for fields, matPath in variants}
+
+        for future in as_completed(futures):
+            try:
+                entry = future.result()
+            except Exception as e:   # one broken variant must not lose the manifest of the others
+                fields, matPath = futures[future]
+                entry = {"name": fields[0], "dir": f"{outDir}/{fields[0]}", "fields": dict(zip(g4gen.FIELDS, fields)),
+                         "materials": matPath, "status": "failed", "error": f"{type(e).__name__}: {e}",
+                         "executable": None}
+            if entry["status"] == "failed":
+                print(f"❌ ERROR: {entry['name']}: {entry['error']}")
+            else:
+                print(f"✅ {entry['name']}" + (f" -> {entry['executable']}" if entry["executable"] else ""))
+            entries.append(entry)
+
+    manifest = {"source": srcDir, "variants": sorted(entries, key=lambda entry: entry["name"])}
+    with open(f"{outDir}/sweep.json.tmp", "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(f"{outDir}/sweep.json.tmp", f"{outDir}/sweep.json")
+    return manifest
+
+# ---------------- Command line ----------------
+parser = argparse.ArgumentParser(
+    description="Generate and build many variants of a Geant4 simulation in parallel",
+    formatter_class=argparse.RawDescriptionHelpFormatter,
+    epilog="""Examples:
+  python g4sweep.py sweep.json
+      Builds every variant of sweep.json from the simulation in the current directory into ./{dir}-sweep.
+
+  python g4sweep.py sweep.json --dir ~/sims/example_det --out /scratch/variants -j 16
+      Builds 16 variants at a time from ~/sims/example_det into /scratch/variants.
+
+  python g4sweep.py sweep.json --no-build
+      Only renders the variants; the manifest lists their directories.
+
+sweep.json:
+  {"grid"  : {"particle": ["proton", "e-"], "partVal": ["1.*GeV", "10.*GeV"]},
+   "points": [{"worldMat": "G4_AIR"}, {"worldMat": "G4_WATER", "materials": "water.csv"}]}
+"""
+)
+
+parser.add_argument(
+    "spec",
+    help="JSON sweep spec with a parameter grid and/or a list of points."
+)
+
+parser.add_argument(
+    "--dir",
+    default=".",
+    help="Template simulation directory holding {dir}.txt and mat.csv (default: current directory)."
+)
+
+parser.add_argument(
+    "--out",
+    type=str,
+    metavar="DIR",
+    help="Directory the variants are created in (default: {dir}-sweep next to the template)."
+)
+
+parser.add_argument(
+    "-j", "--jobs",
+    type=int,
+    metavar="N",
+    help="Variants built at the same time (default: available CPUs)."
+)
+
+parser.add_argument(
+    "--no-build",
+    action="store_true",
+    help="Generate the variants without running cmake and make."
+)
+
+parser.add_argument(
+    "--compiler-cache",
+    choices=["auto"] + g4build.LAUNCHERS + ["off"],
+    default="auto",
+    help="Compiler cache shared by all variants (default: auto, ccache or sccache if installed)."
+)
+
+parser.add_argument(
+    "--cache-dir",
+    type=str,
+    default=g4cache.DEFAULT_DIR,
+    help=f"Directory holding the compiler cache (default: {g4cache.DEFAULT_DIR})."
+)
+
+class Args(Namespace):
+    spec: str
+    dir: str
+    out: str
+    jobs: int
+    no_build: bool
+    compiler_cache: str
+    cache_dir: str
+
+def main():
+    args: Args = parser.parse_args()
+    srcDir = os.path.abspath(os.path.expanduser(args.dir))
+    outDir = os.path.abspath(os.path.expanduser(args.out or f"{srcDir}-sweep"))
+
+    # Paths inside the variants are relative to outDir, so their objects hit each other in ccache
+    launcher = None if args.no_build else g4build.findLauncher(args.compiler_cache)
+    if launcher:
+        cacheDir = os.path.abspath(os.path.expanduser(args.cache_dir))
+        os.environ.update(g4build.launcherEnv(launcher, f"{cacheDir}/{os.path.basename(launcher)}", 10, outDir))
+
+    try:
+        with open(args.spec) as f:
+            spec = json.load(f)
+        manifest = sweep(srcDir, spec, outDir, args.jobs, not args.no_build, launcher,
+                         os.path.dirname(os.path.abspath(args.spec)))
+    except (OSError, ValueError) as e:
+        subprocess.run(["echo", f"❌ ERROR: {e}\n"])
+        sys.exit(1)
+
+    failed = [entry for entry in manifest["variants"] if entry["status"] == "failed"]
+    print(f"\n📦 {len(manifest['variants']) - len(failed)} of {len(manifest['variants'])} variant(s) ready, "
+          f"manifest written to {outDir}/sweep.json\n")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
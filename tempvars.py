@@ -38,15 +38,16 @@ G4VPhysicalVolume *MyDetectorConstruction::Construct()
     G4double zDet   = %s;
     G4double zPVPd  = %s;
 	G4double zPMT   = 10.*mm;
-	G4bool checkOverlaps = true;
+	G4int overlapPoints = %s;	// points sampled per volume by CheckOverlaps, 0 to skip it
 
 	solidWorld = new G4Box("solidWorld", xWorld/2, yWorld/2, zWorld/2);
 	logicWorld = new G4LogicalVolume(solidWorld, worldMat, "logicWorld");
-	phys_World = new G4PVPlacement(0, G4ThreeVector(0., 0., 0.), logicWorld, "phys_World", 0, false, 0, checkOverlaps);
+	phys_World = new G4PVPlacement(0, G4ThreeVector(0., 0., 0.), logicWorld, "phys_World", 0, false, 0);
 
 	solidDetector = new G4Box("solidDetector", xDet/2, yDet/2, zDet/2);
     logicDetector = new G4LogicalVolume(solidDetector, %s, "logicDetector");
-    phys_Detector = new G4PVPlacement(0, G4ThreeVector(0., 0., zPVPd), logicDetector, "phys_Detector", logicWorld, false, 0, checkOverlaps);
+    phys_Detector = new G4PVPlacement(0, G4ThreeVector(0., 0., zPVPd), logicDetector, "phys_Detector", logicWorld, false, 0);
+	if (overlapPoints) phys_Detector -> CheckOverlaps(overlapPoints);
 
 %s
 
@@ -76,6 +77,9 @@ conhh = """
 #include "G4Box.hh"
 #include "G4Tubs.hh"
 #include "G4PVPlacement.hh"
+#include "G4PVReplica.hh"
+#include "G4PVParameterised.hh"
+#include "G4VPVParameterisation.hh"
 #include "G4NistManager.hh"
 #include "G4SystemOfUnits.hh"
 #include "G4GenericMessenger.hh"
@@ -148,17 +152,68 @@ void MyPrimaryGenerator::GeneratePrimaries(G4Event *anEvent)
 
 
 
-# pmt
+# pmt: an nRows x nCols plane of cells filling the +z end of the world, with one of the cell arrays below.
+# The cells are daughters of phys_PMTArray, not of the world: sensitive detector code finds their copy
+# number one level deeper than the world daughters, and GetTranslation() of a cell is relative to the plane.
 pmt = """
-	solidPMT = new G4Box("solidPMT", xWorld/nRows, yWorld/nCols, zPMT);
+	G4double xPMT = xWorld/nRows;
+	G4double yPMT = yWorld/nCols;
+
+	G4Box             *solidPMTArray = new G4Box("solidPMTArray", xWorld/2, yWorld/2, zPMT);
+	G4LogicalVolume   *logicPMTArray = new G4LogicalVolume(solidPMTArray, worldMat, "logicPMTArray");
+	G4VPhysicalVolume *phys_PMTArray = new G4PVPlacement(0, G4ThreeVector(0., 0., zWorld/2 - zPMT), logicPMTArray, "phys_PMTArray", logicWorld, false, 0);
+	if (overlapPoints) phys_PMTArray -> CheckOverlaps(overlapPoints);
+
+	solidPMT = new G4Box("solidPMT", xPMT/2, yPMT/2, zPMT);
 	logicPMT = new G4LogicalVolume(solidPMT, worldMat, "logicPMT");
+%s"""
+
 
+
+# pmt cells, one placement each (copy number i*nCols + j); overlaps are checked cell by cell.
+# Before the other arrays existed these were placed straight in the world, at world coordinates
+pmtPlacement = """
 	for (G4int i = 0; i < nRows; i++)
 	{
 		for (G4int j = 0; j < nCols; j++)
 		{
-			phys_PMT = new G4PVPlacement(0, G4ThreeVector((-xWorld + (i+0.5)*(xWorld*2./nRows))*mm, (-yWorld + (j+0.5)*(yWorld*2./nCols))*mm, zWorld-zPMT),
-												logicPMT, "phys_PMT", logicWorld, false, i * nRows + j, checkOverlaps);
+			phys_PMT = new G4PVPlacement(0, G4ThreeVector(-xWorld/2 + (i+0.5)*xPMT, -yWorld/2 + (j+0.5)*yPMT, 0.),
+										 logicPMT, "phys_PMT", logicPMTArray, false, i * nCols + j);
+			if (overlapPoints) phys_PMT -> CheckOverlaps(overlapPoints);
 		}
 	}
-"""
\ No newline at end of file
+"""
+
+
+
+# pmt cells, as rows replicated along x, each divided into cells along y (replica numbers i at depth 1, j at depth 0)
+pmtReplica = """
+	G4Box           *solidPMTRow = new G4Box("solidPMTRow", xPMT/2, yWorld/2, zPMT);
+	G4LogicalVolume *logicPMTRow = new G4LogicalVolume(solidPMTRow, worldMat, "logicPMTRow");
+
+	new G4PVReplica("phys_PMTRow", logicPMTRow, logicPMTArray, kXAxis, nRows, xPMT);
+	phys_PMT = new G4PVReplica("phys_PMT", logicPMT, logicPMTRow, kYAxis, nCols, yPMT);
+"""
+
+
+
+# pmt cells, as one parameterised volume (copy number i*nCols + j)
+pmtParameterised = """
+	class PMTParameterisation : public G4VPVParameterisation
+	{
+	public:
+		PMTParameterisation(G4int rows, G4int cols, G4double dx, G4double dy) : fRows(rows), fCols(cols), fDx(dx), fDy(dy) {}
+
+		void ComputeTransformation(const G4int copyNo, G4VPhysicalVolume *physVol) const override
+		{
+			physVol -> SetTranslation(G4ThreeVector((copyNo / fCols + 0.5 - 0.5*fRows)*fDx, (copyNo % fCols + 0.5 - 0.5*fCols)*fDy, 0.));
+		}
+
+	private:
+		G4int fRows, fCols;
+		G4double fDx, fDy;
+	};
+
+	phys_PMT = new G4PVParameterised("phys_PMT", logicPMT, logicPMTArray, kUndefined, nRows * nCols,
+									 new PMTParameterisation(nRows, nCols, xPMT, yPMT));
+"""